@@ -1,8 +1,26 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from routers import dxf_route
+from scripts.shift_script_v7 import batch, shift
+from services import uploads
+from utils import executors
+from utils.dxf_v1 import render_pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    render_pool.start()
+    yield
+    render_pool.shutdown()
+    shift.shutdown()
+    batch.shutdown()
+    uploads.shutdown()
+    executors.shutdown()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.include_router(dxf_route.router, prefix="/api/dxf")
 
 
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, UploadFile, HTTPException, BackgroundTasks, Form, File
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, HTTPException, BackgroundTasks, Form, File, Request
+from fastapi.responses import FileResponse, StreamingResponse, RedirectResponse, Response
 from pydantic import BaseModel
-from typing import Optional
+from typing import Literal, Optional
 import os
+import json
+import asyncio
+import mimetypes
 
-from utils import unique
+from constants import modes
+from utils import unique, executors
+from services import storage, uploads
 from utils.dxf_v1 import (
     extract,
     draw,
@@ -13,11 +18,17 @@ from utils.dxf_v1 import (
     cal_length,
     convert,
     markar,
-    filter,
+    render_pool,
+    render_cache,
+    lod,
+    spatial,
+    svg,
+    preview,
 )
-import importlib
+from scripts.shift_script_v7 import shift as shift_engine
+from scripts.shift_script_v7 import batch as shift_batch
+from scripts.shift_script_v7.cache import geometry_cache, shift_sessions
 import traceback
-import sys
 
 
 os.environ["DOTNET_SYSTEM_GLOBALIZATION_INVARIANT"] = "true"
@@ -76,6 +87,43 @@ class Coordinates(BaseModel):
     text_height: Optional[int] = None
 
 
+class Viewport(BaseModel):
+    x_min: float
+    y_min: float
+    x_max: float
+    y_max: float
+
+
+class DrawRequest(Coordinates):
+    viewport: Optional[Viewport] = None  # render only this rectangle of the drawing
+    pixel_width: Optional[int] = None  # output size, the 20x16in figure by default
+    pixel_height: Optional[int] = None
+    format: Literal["png", "svg", "pdf"] = "png"
+    inline: bool = False  # return the image in the response instead of storing it
+    quality: Literal["full", "preview"] = "full"  # preview - fast PNG without axes (png only)
+    sizes: Optional[list[int]] = None  # output widths (pixels, png only), rendered once at the largest
+    defer_upload: bool = False  # answer once rendered, the upload finishes in the background
+
+
+class ShiftSweep(BaseModel):
+    coordinates: list[Coordinate]
+    shifts: list[list[list[int | str]]]  # one shifts list per configuration
+
+
+class Reshift(BaseModel):
+    shifts: list[list[int | str]]
+
+
+class ShiftJob(BaseModel):
+    coordinates: list[Coordinate]
+    shifts: list[list[int | str]]
+
+
+class ShiftBatch(BaseModel):
+    jobs: list[ShiftJob]
+    workers: Optional[int] = None  # jobs in flight at once, at most SHIFT_BATCH_WORKERS (the default)
+
+
 # -------------------------------
 # Helper to delete files in background
 # -------------------------------
@@ -84,6 +132,145 @@ def remove_file(path: str):
         os.remove(path)
 
 
+# -------------------------------
+# Helper to read Accept-Encoding
+# -------------------------------
+def accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Whether an Accept-Encoding header allows gzip: its q-value (or the "*" one when gzip is
+    not listed) must be above 0, "gzip;q=0" refuses it.
+    """
+    qvalues = {}
+    for token in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in token.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding.lower()] = q
+
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qvalues:
+            return qvalues[coding] > 0
+    return False
+
+
+# -------------------------------
+# Helper to build the shift engine input
+# -------------------------------
+def filter_shift_coordinates(coordinates: list[Coordinate], shifts):
+    dicts = [item.model_dump() for item in coordinates]
+    return shift_batch.filter_coordinates(dicts, shifts)
+
+
+def shift_error(e: Exception, status_code: int = 500):
+    # Get full traceback as a string
+    tb_str = traceback.format_exc()
+    # HTTP error with detailed error
+    return HTTPException(
+        status_code=status_code,
+        detail={
+            "error_type": type(e).__name__,
+            "error_message": str(e),
+            "traceback": tb_str,
+        },
+    )
+
+
+# -------------------------------
+# Heavy stages, run off the event loop through utils.executors
+# -------------------------------
+def extract_job(file_path: str, content: bytes, keep_text: bool):
+    with open(file_path, "wb") as f:
+        f.write(content)
+    return extract.extract_entities(file_path, keep_text)
+
+
+def add_lengths_and_markers(coords1, shifts, show_length, show_length_acis, text_height):
+    if show_length or shifts:
+        coords1 = cal_length.add_length_layer_with_shifts_note(
+            entities=coords1, shifts=shifts, text_height=text_height, show_length_acis=show_length_acis
+        )
+        if shifts:
+            coords1 = markar.create_markers(coords1, shifts, text_height, show_length_acis)
+    return coords1
+
+
+def draw_entities_job(coords1, coords2, shifts, show_length, show_length_acis, text_height, viewport=None, width=20, height=16, fmt="png"):
+    if viewport:
+        # Only what intersects the viewport is annotated and rendered, the margin keeps the
+        # labels of entities just outside it, gas/sink boxes always keep all their markers' lines
+        marker_acis = {aci for aci, shift, mode in shifts or [] if mode in (modes.MODES["sink"], modes.MODES["gas"])}
+        margin = 20 + 5 * text_height
+        keep = lambda ent: ent.get("aci") in marker_acis
+        if coords2:
+            # coords2 is paired with coords1 by index, both lists keep the same indices
+            coords1, coords2 = spatial.in_viewport_pairs(coords1, coords2, viewport, margin, keep=keep)
+        else:
+            coords1 = spatial.in_viewport(coords1, viewport, margin, keep=keep)
+
+    coords1 = add_lengths_and_markers(coords1, shifts, show_length, show_length_acis, text_height)
+    entities = (
+        merge_cor.merge_entities_with_dashed(coords1, coords2, type="draw")
+        if coords2
+        else coords1
+    )
+    if fmt in lod.VECTOR_FORMATS:
+        return entities, 0
+    # Level of detail, sub-pixel geometry of large raster drawings is culled (labeled entities are kept)
+    return lod.cull(
+        entities, width, height, keep=lod.label_filter(show_length, shifts, show_length_acis), extent=viewport
+    )
+
+
+def generate_job(coords1, coords2, shifts, show_length, show_length_acis, text_height):
+    coords1 = add_lengths_and_markers(coords1, shifts, show_length, show_length_acis, text_height)
+    merged_entities = (
+        merge_cor.merge_entities_with_dashed(coords1, coords2, type="dxf")
+        if coords2
+        else coords1
+    )
+    return generate.build_dxf(entities=merged_entities)
+
+
+def convert_dwg_job(coords1, coords2, shifts, show_length, show_length_acis):
+    if show_length or shifts:
+        coords1 = cal_length.add_length_layer_with_shifts_note(coords1, shifts, show_length_acis=show_length_acis)
+
+    # 1) Generate DXF
+    dxf_path = generate.generate_dxf(
+        entities=(
+            merge_cor.merge_entities_with_dashed(coords1, coords2)
+            if coords2
+            else coords1
+        )
+    )
+
+    # 2) Convert DXF → DWG
+    return convert.convert_dxf_to_dwg(dxf_path, output_dir="/tmp")
+
+
+def shift_job(coordinates, shifts):
+    session = shift_engine.ShiftSession(cache=geometry_cache)
+    return session.run(coordinates, shifts)
+
+
+def sweep_job(coordinates, shifts_list):
+    session = shift_engine.ShiftSession(cache=geometry_cache)
+    return session.sweep(coordinates, shifts_list)
+
+
+def start_session_job(coordinates, shifts):
+    session = shift_engine.ShiftSession(cache=geometry_cache)
+    return session, session.run(coordinates, shifts)
+
+
 # -------------------------------
 # /extract endpoint
 # -------------------------------
@@ -93,10 +280,8 @@ async def read_dxf_file(file: UploadFile = File(...), keep_text: bool = Form(Fal
     file_path = f"./tmp/{unique.unique_string(20)}.dxf"
 
     try:
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-
-        coordinates = extract.extract_entities(file_path, keep_text)
+        content = await file.read()
+        coordinates = await executors.run("extract", extract_job, file_path, content, keep_text)
         return {"success": True, "coordinates": coordinates}
 
     except ValueError as e:
@@ -114,10 +299,7 @@ async def read_dxf_file(file: UploadFile = File(...), keep_text: bool = Form(Fal
 # /draw endpoint
 # -------------------------------
 @router.post("/draw")
-async def draw_dxf_file(body: Coordinates, background_tasks: BackgroundTasks):
-    # Ensure temporary folder exists
-    os.makedirs("./tmp", exist_ok=True)
-
+async def draw_dxf_file(body: DrawRequest):
     # Convert required coordinates to dicts
     coords1 = [c.model_dump() for c in body.coordinates]
 
@@ -133,33 +315,134 @@ async def draw_dxf_file(body: Coordinates, background_tasks: BackgroundTasks):
     # length font size
     text_height = body.text_height or 16
 
-    if show_length or shifts:
-        coords1 = cal_length.add_length_layer_with_shifts_note(
-            entities=coords1, shifts=shifts, text_height=text_height, show_length_acis=show_length_acis
+    # Optional viewport and output size (pixels, at 72 dpi)
+    viewport = None
+    if body.viewport:
+        viewport = (body.viewport.x_min, body.viewport.y_min, body.viewport.x_max, body.viewport.y_max)
+        if viewport[2] <= viewport[0] or viewport[3] <= viewport[1]:
+            raise HTTPException(status_code=400, detail="viewport x_max/y_max must be greater than x_min/y_min")
+    if (body.pixel_width is not None and body.pixel_width <= 0) or (body.pixel_height is not None and body.pixel_height <= 0):
+        raise HTTPException(status_code=400, detail="pixel_width and pixel_height must be positive")
+    if (body.pixel_width or 0) > draw.MAX_PIXELS or (body.pixel_height or 0) > draw.MAX_PIXELS:
+        raise HTTPException(status_code=400, detail=f"pixel_width and pixel_height must be at most {draw.MAX_PIXELS}")
+    width = body.pixel_width / 72 if body.pixel_width else 20
+    height = body.pixel_height / 72 if body.pixel_height else 16
+
+    fmt = body.format
+
+    # Several output widths: one render at the largest, the others are downsampled from it
+    sizes = sorted(set(body.sizes), reverse=True) if body.sizes else None
+    if sizes:
+        if fmt != "png" or body.inline:
+            raise HTTPException(status_code=400, detail="sizes is only supported for stored png images")
+        if sizes[-1] <= 0:
+            raise HTTPException(status_code=400, detail="sizes must be positive")
+        if len(sizes) > draw.MAX_SIZES or sizes[0] > draw.MAX_PIXELS:
+            raise HTTPException(
+                status_code=400, detail=f"at most {draw.MAX_SIZES} sizes of at most {draw.MAX_PIXELS} pixels"
+            )
+        width, height = sizes[0] / 72, sizes[0] / 72 * height / width
+    # svg is already direct and pdf stays vector, preview only changes the PNG renderer
+    quality = body.quality if fmt == "png" else "full"
+
+    # Identical drawings are rendered and stored once, hashing the request and the cache
+    # index (dbm file) stay off the event loop
+    key = await executors.run(
+        "draw", render_cache.render_key,
+        coords1, coords2, shifts, show_length, show_length_acis, text_height, viewport, (width, height), fmt, quality, sizes,
+        local=True,
+    )
+    cached = await executors.run("draw", render_cache.lookup, key, local=True) if not body.inline else None
+
+    # One stored image per size, named after the render hash
+    names = [f"{key}-{size}" for size in sizes] if sizes else [key]
+    keys = [draw.image_key(name, fmt) for name in names]
+    if cached:
+        # only stored renders are cached, they are always ready
+        return {"success": True, **cached, "keys": keys, "status": uploads.READY, "cached": True}
+
+    entities, culled = await executors.run(
+        "draw", draw_entities_job, coords1, coords2, shifts, show_length, show_length_acis, text_height,
+        viewport, width, height, fmt
+    )
+
+    if fmt == "svg":
+        # SVG is written directly from the entities, no matplotlib worker needed
+        image = await executors.run("draw", svg.render_svg, entities, width, height, viewport=viewport)
+    elif quality == "preview":
+        # Pillow preview, cheap enough for the draw executor
+        image = await executors.run("draw", preview.render_preview, entities, width, height, viewport=viewport)
+    else:
+        # Render in the pre-warmed worker pool, a requested pixel size or viewport is kept exactly
+        # like the svg and preview renderers do, the default figure is cropped to its content
+        # (sizes are downsampled from this render, it must be exactly sizes[0] wide)
+        exact_size = bool(body.pixel_width or body.pixel_height or viewport or sizes)
+        image = await render_pool.render(
+            entities, width=width, height=height, viewport=viewport, fmt=fmt, exact_size=exact_size
         )
-        if shifts:
-            coords1 = markar.create_markers(coords1, shifts, text_height, show_length_acis)
 
-    # Call the drawing function
-    image_path, file_path = draw.draw_entities(
-        entities=(
-            merge_cor.merge_entities_with_dashed(coords1, coords2, type="draw")
-            if coords2
-            else coords1
+    if body.inline:
+        return Response(
+            content=image,
+            media_type=draw.CONTENT_TYPES[fmt],
+            headers={"X-Culled-Entities": str(culled)},
+        )
+
+    images = await executors.run("draw", draw.downsample, image, sizes) if sizes else [image]
+
+    if body.defer_upload:
+        # The urls are known before the upload, the client polls /draw/status/{key} or HEAD /files/{key}
+        image_paths = [storage.get_storage().url(k) for k in keys]
+    else:
+        # Upload every image from memory at once
+        image_paths = await asyncio.gather(
+            *(
+                executors.run("draw", draw.upload_image, data, name, fmt, local=True)
+                for data, name in zip(images, names)
+            )
         )
-    )
 
-    background_tasks.add_task(remove_file, file_path)
-    return {"success": True, "image_path": image_path}
+    render = {"image_path": image_paths[0], "culled": culled}
+    if sizes:
+        render["images"] = [{"width": size, "image_path": path} for size, path in zip(sizes, image_paths)]
+
+    if body.defer_upload:
+        # Cached only once stored, a failed upload is rendered again next time
+        uploads.submit(
+            [(k, data, draw.CONTENT_TYPES[fmt]) for k, data in zip(keys, images)],
+            on_done=lambda: render_cache.store(key, render),
+        )
+        return {"success": True, **render, "keys": keys, "status": uploads.PENDING, "cached": False}
+
+    await executors.run("draw", render_cache.store, key, render, local=True)
+    return {"success": True, **render, "keys": keys, "status": uploads.READY, "cached": False}
+
+
+# -------------------------------
+# /draw/status endpoint
+# -------------------------------
+@router.get("/draw/status/{key:path}")
+async def draw_upload_status(key: str):
+    try:
+        status = await executors.run("draw", uploads.status, key, local=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "key": key, **status}
+
+
+# -------------------------------
+# /draw/cache endpoint
+# -------------------------------
+@router.get("/draw/cache")
+async def draw_cache_stats():
+    return {"success": True, "cache": render_cache.stats()}
 
 
 # -------------------------------
 # /generate endpoint
 # -------------------------------
 @router.post("/generate")
-async def generate_dxf_file(body: Coordinates, background_tasks: BackgroundTasks):
-    os.makedirs("./tmp", exist_ok=True)
-
+async def generate_dxf_file(body: Coordinates, request: Request):
     # Convert required coordinates to dicts
     coords1 = [c.model_dump() for c in body.coordinates]
 
@@ -175,24 +458,62 @@ async def generate_dxf_file(body: Coordinates, background_tasks: BackgroundTasks
     # length font size
     text_height = body.text_height or 16
 
-    if show_length or shifts:
-        coords1 = cal_length.add_length_layer_with_shifts_note(
-            entities=coords1, shifts=shifts, text_height=text_height, show_length_acis=show_length_acis
-        )
-        if shifts:
-            coords1 = markar.create_markers(coords1, shifts, text_height, show_length_acis)
+    # The document stays in this process, it is written straight to the response
+    doc = await executors.run(
+        "generate", generate_job, coords1, coords2, shifts, show_length, show_length_acis, text_height, local=True
+    )
 
-    merged_entities = (
-        merge_cor.merge_entities_with_dashed(coords1, coords2, type="dxf")
-        if coords2
-        else coords1
+    # Streamed while it is written, gzipped for clients accepting it
+    gzip_level = generate.GZIP_LEVEL if accepts_gzip(request.headers.get("accept-encoding", "")) else 0
+    headers = {"Vary": "Accept-Encoding"}
+    if gzip_level:
+        headers["Content-Encoding"] = "gzip"
+    # The writer takes a "generate" slot for as long as it streams, like the other stages
+    loop = asyncio.get_running_loop()
+
+    def start_writer(write):
+        return asyncio.run_coroutine_threadsafe(executors.run("generate", write, local=True), loop)
+
+    return StreamingResponse(
+        generate.stream_dxf(doc, gzip_level, start=start_writer),
+        media_type=mimetypes.guess_type("drawing.dxf")[0] or "application/dxf",
+        headers=headers,
     )
 
-    file_path = generate.generate_dxf(entities=merged_entities)
 
-    # Schedule file deletion after response
-    background_tasks.add_task(remove_file, file_path)
-    return FileResponse(file_path)
+# -------------------------------
+# /files endpoint, serves the local and memory storage backends
+# -------------------------------
+@router.head("/files/{key:path}")
+async def stored_file_ready(key: str):
+    # 200 once the file is stored, 404 while its upload is pending (or failed)
+    try:
+        status = await executors.run("draw", uploads.status, key, local=True)
+    except ValueError:
+        return Response(status_code=400)
+    return Response(status_code=200 if status["status"] == uploads.READY else 404)
+
+
+@router.get("/files/{key:path}")
+async def get_stored_file(key: str):
+    backend = storage.get_storage()
+    if isinstance(backend, storage.S3Storage):
+        return RedirectResponse(backend.url(key))
+
+    try:
+        if isinstance(backend, storage.LocalStorage):
+            path = backend.path(key)
+            if os.path.isfile(path):
+                return FileResponse(path)
+            data = None
+        else:
+            data = backend.get(key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if data is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return Response(content=data, media_type=mimetypes.guess_type(key)[0] or "application/octet-stream")
 
 
 # -------------------------------
@@ -200,30 +521,100 @@ async def generate_dxf_file(body: Coordinates, background_tasks: BackgroundTasks
 # -------------------------------
 @router.post("/shift")
 async def shift_dxf_file(body: Coordinates):
-    module_name = "scripts.shift_script_v7.shift"
     try:
-        if module_name in sys.modules:
-            del sys.modules[module_name]
-
-        shift_module = importlib.import_module(module_name)
-        dicts = [item.model_dump() for item in body.coordinates]
-        filterd_coordinates = filter.filter_points(dicts, body.shifts)
-        filterd_coordinates = filter.remove_entites(dicts, body.shifts)
-        new_coordinates = shift_module.main(filterd_coordinates, body.shifts)
+        filterd_coordinates = filter_shift_coordinates(body.coordinates, body.shifts)
+        new_coordinates = await executors.run("shift", shift_job, filterd_coordinates, body.shifts)
         return {"success": True, "coordinates": new_coordinates}
 
     except Exception as e:
-        # Get full traceback as a string
-        tb_str = traceback.format_exc()
-        # Raise HTTP 500 with detailed error
-        raise HTTPException(
-            status_code=500,
-            detail={
-                "error_type": type(e).__name__,
-                "error_message": str(e),
-                "traceback": tb_str,
-            },
+        raise shift_error(e)
+
+
+# -------------------------------
+# /shift/sweep endpoint
+# -------------------------------
+@router.post("/shift/sweep")
+async def sweep_dxf_file(body: ShiftSweep):
+    """Shift the same coordinates with several shift configurations, parsing and matching them once."""
+    try:
+        if not body.shifts:
+            raise ValueError("Error: no shift configurations to sweep")
+        filterd_coordinates = filter_shift_coordinates(body.coordinates, body.shifts[0])
+        results = await executors.run("shift", sweep_job, filterd_coordinates, body.shifts)
+        return {"success": True, "results": results}
+
+    except ValueError as e:
+        raise shift_error(e, status_code=400)
+
+    except Exception as e:
+        raise shift_error(e)
+
+
+# -------------------------------
+# /shift/session endpoints
+# -------------------------------
+@router.post("/shift/session")
+async def start_shift_session(body: Coordinates):
+    """Full shift like /shift, the session is kept so the next shift values only send back what moved."""
+    try:
+        filterd_coordinates = filter_shift_coordinates(body.coordinates, body.shifts)
+        # the session stays in this process, so it always runs in a thread
+        session, new_coordinates = await executors.run(
+            "shift", start_session_job, filterd_coordinates, body.shifts, local=True
         )
+        session_id = unique.unique_string(20)
+        shift_sessions.set(session_id, session)
+        return {"success": True, "session_id": session_id, "coordinates": new_coordinates}
+
+    except Exception as e:
+        raise shift_error(e)
+
+
+@router.post("/shift/session/{session_id}")
+async def reshift_session(session_id: str, body: Reshift):
+    """Re-shift a kept session with new shift values, returns only the moved vertices, circles and electric."""
+    session = shift_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Shift session not found or expired")
+    try:
+        delta = await executors.run("shift", session.reshift, body.shifts, local=True)
+        return {"success": True, "session_id": session_id, "delta": delta}
+
+    except ValueError as e:
+        raise shift_error(e, status_code=400)
+
+    except Exception as e:
+        raise shift_error(e)
+
+
+# -------------------------------
+# /shift/batch endpoint
+# -------------------------------
+@router.post("/shift/batch")
+def shift_batch_files(body: ShiftBatch):
+    """Shift many drawings on a process pool, streams one NDJSON line per drawing as it finishes."""
+    jobs = [{"coordinates": [item.model_dump() for item in job.coordinates], "shifts": job.shifts} for job in body.jobs]
+
+    def results():
+        # every request shares one spawned pool, workers only bounds this request's share
+        for result in shift_batch.run_batch(jobs, body.workers, shift_batch.get_pool()):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+# -------------------------------
+# /shift/cache endpoint
+# -------------------------------
+@router.get("/shift/cache")
+async def shift_cache_stats():
+    # the counters are this process' cache: with DXF_EXECUTOR=process, /shift and /shift/sweep
+    # run in the worker processes, each with its own cache, and only the sessions show up here
+    if executors.EXECUTOR_KIND == "process":
+        scope = "server process only, /shift and /shift/sweep use the caches of the worker processes"
+    else:
+        scope = "all shift jobs"
+    return {"success": True, "cache": geometry_cache.stats(), "scope": scope}
 
 
 # -------------------------------
@@ -240,25 +631,13 @@ async def convert_to_dwg(body: Coordinates, background_tasks: BackgroundTasks):
     show_length = body.show_length
     show_length_acis = body.show_length_acis
 
-    if show_length or shifts:
-        coords1 = cal_length.add_length_layer_with_shifts_note(coords1, shifts, show_length_acis=show_length_acis)
-
     # -------------------------------
-    # 1) Generate DXF
+    # Generate DXF and convert DXF → DWG
     # -------------------------------
-    dxf_path = generate.generate_dxf(
-        entities=(
-            merge_cor.merge_entities_with_dashed(coords1, coords2)
-            if coords2
-            else coords1
-        )
+    dwg_path = await executors.run(
+        "convert-dwg", convert_dwg_job, coords1, coords2, shifts, show_length, show_length_acis
     )
 
-    # -------------------------------
-    # 2) Convert DXF → DWG
-    # -------------------------------
-    dwg_path = convert.convert_dxf_to_dwg(dxf_path, output_dir="/tmp")
-
     # -------------------------------
     # 3) Cleanup temp files
     # -------------------------------
@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import argparse
+import itertools
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.dxf_v1 import filter
+from scripts.shift_script_v7.shift import ShiftSession
+from scripts.shift_script_v7.cache import geometry_cache
+from scripts.shift_script_v7.config import shift_batch_workers
+
+############################################################################################################################################
+######################################################### Jobs #############################################################################
+############################################################################################################################################
+
+def filter_coordinates(coordinates, shifts):
+    # the shift engine input, same filtering as the /shift endpoint
+    filterd_coordinates = filter.filter_points(coordinates, shifts)
+    filterd_coordinates = filter.remove_entites(coordinates, shifts)
+    return filterd_coordinates
+
+def shift_job(index, job):
+    """
+    Shifts one {"coordinates", "shifts"} job, runs in the batch pool.
+    Never raises, a failing drawing is reported in its own result so the batch goes on.
+    """
+    try:
+        # the engine banners would end up in the middle of the streamed results
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            coordinates = filter_coordinates(job["coordinates"], job["shifts"])
+            new_coordinates = ShiftSession(cache=geometry_cache).run(coordinates, job["shifts"])
+        return {"index": index, "success": True, "coordinates": new_coordinates}
+
+    except Exception as e:
+        return {"index": index, "success": False, "error_type": type(e).__name__, "error_message": str(e)}
+
+############################################################################################################################################
+######################################################### Pool #############################################################################
+############################################################################################################################################
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _max_workers():
+    return shift_batch_workers or os.cpu_count() or 1
+
+def _new_pool(workers):
+    # spawned, forking a server process with running threads can deadlock the workers
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def get_pool():
+    """
+    The batch pool shared by every /shift/batch request (SHIFT_BATCH_WORKERS processes),
+    created on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _new_pool(_max_workers())
+        return _pool
+
+def _discard_pool(pool):
+    # a worker of the shared pool died, the next batches get a fresh one
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def run_batch(jobs, workers=None, pool=None):
+    """
+    Shifts the jobs on a process pool and yields every result as soon as it is done
+    (not in the jobs order, each result has its job index). jobs can be any iterable,
+    at most 2 jobs per worker are in flight so a long job stream is never loaded at once.
+    workers is capped at SHIFT_BATCH_WORKERS (one per cpu by default). Without a pool one
+    is started for the batch, with a shared one (get_pool()) workers only bounds how
+    many of the batch's jobs are in flight.
+    """
+    workers = max(1, min(workers or _max_workers(), _max_workers()))
+    with contextlib.ExitStack() as stack:
+        if pool is None:
+            pool = stack.enter_context(_new_pool(workers))
+        pending = {}
+        jobs = iter(enumerate(jobs))
+        try:
+            while True:
+                for index, job in jobs:
+                    pending[pool.submit(shift_job, index, job)] = index
+                    if len(pending) >= 2 * workers:
+                        break
+
+                if not pending:
+                    return
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        yield future.result()
+                    except Exception as e: # the worker itself died (BrokenProcessPool...)
+                        if isinstance(e, BrokenProcessPool) and pool is _pool:
+                            _discard_pool(pool)
+                        yield {"index": index, "success": False, "error_type": type(e).__name__, "error_message": str(e)}
+        finally:
+            # the consumer stopped early (client disconnected...), drop what did not start yet
+            for future in pending:
+                future.cancel()
+
+############################################################################################################################################
+########################################################## CLI #############################################################################
+############################################################################################################################################
+
+def _read_jobs(f):
+    # a JSON array of jobs, or one job per line (NDJSON)
+    first = f.read(1)
+    while first.isspace():
+        first = f.read(1)
+    if first == "[":
+        yield from json.loads(first + f.read())
+        return
+
+    lines = [first + f.readline()] if first else []
+    for line in itertools.chain(lines, f):
+        if line.strip():
+            yield json.loads(line)
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Shift many drawings, one NDJSON result line per drawing as soon as it is done.")
+    parser.add_argument("input", help="jobs file, a JSON array or NDJSON of {coordinates, shifts} (- for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="results NDJSON file (default stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="pool processes (default SHIFT_BATCH_WORKERS or one per cpu)")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    with contextlib.ExitStack() as stack:
+        f_in = sys.stdin if args.input == "-" else stack.enter_context(open(args.input, "r"))
+        f_out = sys.stdout if args.output == "-" else stack.enter_context(open(args.output, "w"))
+        for result in run_batch(_read_jobs(f_in), args.workers):
+            failed += not result["success"]
+            f_out.write(json.dumps(result) + "\n")
+            f_out.flush()
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(cli())
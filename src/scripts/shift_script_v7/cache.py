@@ -0,0 +1,14 @@
+from utils.cache import LRUCache, canonical_hash
+from scripts.shift_script_v7.config import geometry_cache_size, geometry_cache_ttl, shift_sessions_size, shift_sessions_ttl
+
+# shared by all the shift sessions of the process, maps geometry_key() to ShiftSession._geometry()
+geometry_cache = LRUCache(max_size=geometry_cache_size, ttl=geometry_cache_ttl)
+
+# session id -> ShiftSession kept after a full run, for ShiftSession.reshift()
+shift_sessions = LRUCache(max_size=shift_sessions_size, ttl=shift_sessions_ttl)
+
+def geometry_key(data, shifts, tolerance=None):
+    # the parsed & matched geometry only depends on the data, on which category
+    # each color belongs to and on the endpoint matching tolerance, not on the shift values
+    categories = sorted({(color, code) for color, shitf, code in shifts})
+    return canonical_hash({"data": data, "categories": categories, "tolerance": tolerance})
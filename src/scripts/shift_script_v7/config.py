@@ -1,3 +1,5 @@
+import os
+
 colors_categories_dict = {
     1: "outline",
     2: "inside",
@@ -51,6 +53,13 @@ categories_to_code_dict = {
     "electric_cr": 9,
 }
 
+# headless by default, set SHIFT_DEBUG_DIR to render the diagnostic shapes image (debug mode)
+debug_render_dir = os.environ.get("SHIFT_DEBUG_DIR") or None
+
+# parsed & matched geometry cache (entries, seconds to live - 0 for no expiry)
+geometry_cache_size = int(os.environ.get("SHIFT_CACHE_SIZE", 64))
+geometry_cache_ttl = float(os.environ.get("SHIFT_CACHE_TTL", 600))
+
 smartscale_3d = [
 "  ______                              _____    _________    ______     _____                _         _______ ",
 " / ____ \  |¯¯\    /¯¯|      /\      |  __ \  |___   ___|  / ____ \   / ____|      /\      | |       |  _____|",
@@ -59,3 +68,17 @@ smartscale_3d = [
 " _____) |  | | \__/ | |   / ____ \   | | \ \      | |      _____) |  | |____    / ____ \   | |_____  | |_____ ",
 "|______/   |_|      |_|  /_/    \_\  |_|  \_\     |_|     |______/    \_____|  /_/    \_\  |_______| |_______|",
 ]
+
+# shift sessions kept for incremental re-shifts (entries, seconds to live - 0 for no expiry)
+shift_sessions_size = int(os.environ.get("SHIFT_SESSIONS_SIZE", 32))
+shift_sessions_ttl = float(os.environ.get("SHIFT_SESSIONS_TTL", 1800))
+
+# outline loops are shifted in a process pool once a drawing has this many of them (workers - 0 for one per cpu)
+shift_pool_min_loops = int(os.environ.get("SHIFT_POOL_MIN_LOOPS", 64))
+shift_pool_workers = int(os.environ.get("SHIFT_POOL_WORKERS", 0)) or None
+
+# processes of the batch pool (/shift/batch and the batch CLI) - 0 for one per cpu
+shift_batch_workers = int(os.environ.get("SHIFT_BATCH_WORKERS", 0)) or None
+
+# outline endpoints closer than this are matched as the same vertex (0 - exact coordinates)
+shift_match_tolerance = float(os.environ.get("SHIFT_MATCH_TOLERANCE", 0)) or None
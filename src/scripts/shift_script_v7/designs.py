@@ -1,8 +1,6 @@
 # from main import Designs._get_intersection
 from scripts.shift_script_v7.point import Point
 
-from matplotlib.patches import Circle, Ellipse
-import matplotlib.pyplot as plt
 import numpy as np
 import math
 
@@ -24,6 +22,22 @@ class Designs:
         py = ((p1.x*p2.y - p1.y*p2.x)*(p3.y-p4.y) - (p1.y-p2.y)*(p3.x*p4.y - p3.y*p4.x)) / denom
         return (px, py)
 
+    # designs are kept as plain data, matplotlib patches are only built when drawing
+    def to_patch(design):
+        from matplotlib.patches import Circle, Ellipse
+
+        if design["type"] == "ellipse":
+            return Ellipse(
+                xy=design["center"],
+                width=design["width"],
+                height=design["height"],
+                angle=design["angle"], # degrees
+                fill=False,
+                linewidth=LINE_WIDTH,
+                color="blue"
+            )
+        return Circle(design["center"], design["radius"], fill=False, linewidth=LINE_WIDTH, color="blue")
+
     ############################################################################################################################################
     ############################################################# Line #########################################################################
     ############################################################################################################################################
@@ -65,6 +79,8 @@ class Designs:
                 return Point(mid_x, mid_y)
             
         def draw(self):
+            import matplotlib.pyplot as plt
+
             plt.plot(self.p1.x, self.p1.y, 'o', c="blue", zorder=100)
             plt.plot(self.p2.x, self.p2.y, 'o', c="blue", zorder=100)
             plt.plot(self.mid_point.x, self.mid_point.y, 'o', c="red", zorder=100)
@@ -119,20 +135,20 @@ class Designs:
                                                         (side_B1.mid_point, side_B2.mid_point))
             self.center = Point(x_center, y_center)
 
-            ellipse = Ellipse(
-                xy=(self.center.x, self.center.y),
-                width=self.width,
-                height=self.height,
-                angle=self.angle, # degrees
-                fill=False,
-                linewidth=LINE_WIDTH,
-                color="blue"
-            )
-            self.designs.append(ellipse)
+            self.ellipse = {
+                "type": "ellipse",
+                "center": (self.center.x, self.center.y),
+                "width": self.width,
+                "height": self.height,
+                "angle": self.angle, # degrees
+            }
+            self.designs.append(self.ellipse)
             return
 
 
         def show(self):
+            import matplotlib.pyplot as plt
+
             fig, ax = plt.subplots()
 
             # draw the outside shape
@@ -145,7 +161,7 @@ class Designs:
             plt.plot(self.center.x, self.center.y, 'o', c="red", zorder=100)
 
             # draw the inner shape
-            ax.add_patch(self.ellipse)
+            ax.add_patch(Designs.to_patch(self.ellipse))
 
             plt.show()
             return
@@ -201,13 +217,15 @@ class Designs:
                 center = Point(x_center, y_center)
                 self.centers.append(center)
 
-                circle = Circle((center.x, center.y), self.radius, fill=False, linewidth=LINE_WIDTH, color="blue")
+                circle = {"type": "circle", "center": (center.x, center.y), "radius": self.radius}
                 self.designs.append(circle)
 
             return
 
 
         def show(self):
+            import matplotlib.pyplot as plt
+
             fig, ax = plt.subplots()
 
             # draw the outside shape
@@ -222,7 +240,7 @@ class Designs:
 
             # draw the inner shapes
             for circle in self.designs:
-                ax.add_patch(circle)
+                ax.add_patch(Designs.to_patch(circle))
 
             plt.show()
             return
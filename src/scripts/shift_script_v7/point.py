@@ -1,7 +1,10 @@
 from scripts.shift_script_v7.config import aci_color_code_dict
-import numpy as np
+import math
 
 class Point:
+  # outlines hold thousands of points, slots keep them small and fast to create
+  __slots__ = ("_info", "_color_code", "x", "y")
+
   def __init__(self, x, y, info=[], color=0):
     self._info = info # to store the original point's position in the data file
     self._color_code = color
@@ -12,7 +15,7 @@ class Point:
   def distance(self, point):
     x1, y1 = (self.x, self.y)
     x2, y2 = (point.x, point.y)
-    distance = np.sqrt((x1-x2)**2 + (y1-y2)**2)
+    distance = math.hypot(x1-x2, y1-y2)
     return distance
 
   def move(self, delta_x=0, delta_y=0):
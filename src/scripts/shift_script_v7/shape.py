@@ -1,5 +1,4 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
 from scripts.shift_script_v7.config import aci_color_code_dict
 
@@ -8,9 +7,15 @@ class Shape:
         self.points = list_of_points
         self.n = len(self.points)
         self.color = color
-        self.area = self.calculate_area()
+        self._area = None # computed on first use, the shift itself never needs it
         return
 
+    @property
+    def area(self):
+        if self._area is None:
+            self._area = self.calculate_area()
+        return self._area
+
     def calculate_area(self):
         if self.n < 3:
             print("not a polygon")
@@ -27,7 +32,7 @@ class Shape:
 
     def change_point(self, index, new_point):
         self.points[index] = new_point
-        self.area = self.calculate_area()
+        self._area = None
         return
 
     def _copy_points(self):
@@ -40,6 +45,8 @@ class Shape:
         return Shape(self._copy_points(), color)
 
     def exshow(self, to_export=False):
+        import matplotlib.pyplot as plt
+
         xs = []
         ys = []
         colors = []
@@ -64,6 +71,8 @@ class Shape:
         return
 
     def show(self, to_export=False):
+        import matplotlib.pyplot as plt
+
         for i in range(self.n):
             point = self.points[i]
             c = aci_color_code_dict[point._color_code]
@@ -1,11 +1,16 @@
 
 
+import os
 import sys
+import copy
 import json
 import math
+import threading
+import multiprocessing
 import numpy as np
-import matplotlib.pyplot as plt
 from typing import List
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 from scripts.shift_script_v7.point import Point
 from scripts.shift_script_v7.shape import Shape
@@ -14,9 +19,14 @@ from scripts.shift_script_v7.config import (
     aci_color_code_dict, 
     aci_color_code_inverse_dict, 
     categories_to_code_dict, 
-    smartscale_3d
+    smartscale_3d,
+    debug_render_dir,
+    shift_pool_min_loops,
+    shift_pool_workers,
+    shift_match_tolerance
 )
 from scripts.shift_script_v7.designs import Designs
+from scripts.shift_script_v7.cache import geometry_key
 
 X = 0 ; Y = 1
 valide_entity_types = ["LWPOLYLINE", "POINT", "LINE", "CIRCLE"]
@@ -28,13 +38,10 @@ design_categories = {
     "gas"  : Designs.Kitchen_Gas,
     "electric"  : None,
 }
-design_parts = []
 ###
 
-electric_objs = [] # v7
-circles_objs = [] # v7
-
-colors_shift_dict = {
+### ShiftSession owns the per-request state, these are only the defaults it starts from
+default_colors_shift_dict = {
     "purple"   : 0,
     "darkgray" : 0,
     "orange"   : 0,
@@ -45,14 +52,6 @@ colors_shift_dict = {
     "yellow"   : 0,
 }
 
-outline_colors    = []
-inside_colors     = []
-ignore_colors     = []
-remove_colors     = []
-keep_point_colors = []
-circles_colors    = []
-electric_colors   = []
-
 ############################################################################################################################################
 ####################################################### Utilities ##########################################################################
 ############################################################################################################################################
@@ -79,39 +78,6 @@ def _print_banner(text):
 ##################################################### Data Parsing #########################################################################
 ############################################################################################################################################
 
-# divides the colors into 7 lists according to the categories code from shifts
-# and fills colors_shift_dict with the shift amount for each color
-def _parse_colors_list(shifts):
-    # _print_banner("Colors & Shitfs")
-    categories = ["outline", "inside", "ignore", "remove", "keep_point", "circles", "electric"]
-    lists = [outline_colors, inside_colors, ignore_colors, remove_colors, keep_point_colors, circles_colors, electric_colors]
-
-    for line in shifts:
-        color, shitf, code = line
-        # print(f"code={code}")
-        colors_shift_dict[aci_color_code_dict[color]] = shitf
-        ### added in v6 to support sink, gas and electric ignore
-        list_type = 2 if code in ignore_codes else code-1
-        ###
-        ### added in v7 to support circles and electric
-        if code == categories_to_code_dict["electric_cr"]:
-            list_type = 5 # add to circles_colors list
-        elif code == categories_to_code_dict["electric_sq"]:
-            list_type = 6 # add to electric_colors list
-        ###
-        lists[list_type].append(color)
-
-    for i in range(len(lists)):
-        # print(f"\n{categories[i]} colors list:")
-        for color in lists[i]:
-            shitf = colors_shift_dict[aci_color_code_dict[color]]
-            # if isinstance(shitf, str): # v7 - electric
-            #     # print(f"{aci_color_code_dict[color]} ({shitf})")
-            # else:
-            #     # print(f"{aci_color_code_dict[color]} ({('+' if shitf > 0 else '') + str(shitf)})")
-
-    return
-
 def _parse_line(line):
     if line["entity_type"] == "LWPOLYLINE":
         vertices = line["vertices"]
@@ -123,91 +89,6 @@ def _parse_line(line):
         vertices = []
     return vertices
 
-def parse_data(data, to_print=False):
-    _print_banner("Parse Data")
-    outline_points = []
-    inside_points = []
-    ignore_points = []
-    counter = 0
-    design_counter = 0 # to keep track of sync, gas, electric...
-    # if "coordinates" in data:
-    for line in data:
-        if "entity_type" in line and "layer" in line and "aci" in line:
-            if line["entity_type"].upper() in valide_entity_types and line["layer"] != "Frames":
-                
-                ### added in v5 to only keep points that in color code "keep_point" category
-                if (line["entity_type"] == "POINT") and (line["aci"] not in keep_point_colors):
-                    continue
-                ###
-
-                ### added in v7 to support circles
-                if line["entity_type"] == "CIRCLE":
-                    if line["aci"] in circles_colors:
-                        if "center" in line and "radius" in line:
-                            # the circle is valide and need change
-                            # if to_print:
-                            #     print("circle detected!f")
-                            circle = create_circlex_object(line)
-                            circles_objs.append(circle)
-
-                    # skip points parsing for circle entity
-                    continue
-                ###
-
-                for design_category in design_categories.keys():
-                    if design_category in line["layer"]:
-                        design_parts.append((design_counter, design_category))
-
-                vertices = _parse_line(line)
-                # if to_print:
-                    # print("###############################################################################################")
-                    # print(line["entity_type"])
-                    # print(vertices)
-
-                to_incease_counter = True if line["aci"] in outline_colors or line["aci"] in inside_colors else False
-
-                points = []
-                for point in vertices:
-                    # if to_print:
-                    #     print(point)
-
-                    if "x" in point and "y" in point:
-                        # points.append(Point(round(point["x"]), round(point["y"]), info=[counter], color=line["aci"])) # v6R - ignore
-                        points.append(Point(point["x"], point["y"], info=[counter], color=line["aci"])) # v6
-                        # if to_print:
-                        #     print(f"created {points[-1]}")
-                        if to_incease_counter:
-                            counter += 1
-
-                if line["aci"] in outline_colors:
-                    outline_points.append(points)
-                elif line["aci"] in inside_colors:
-                    inside_points.append(points)
-                elif line["aci"] in ignore_colors:
-                    ignore_points.append(points)
-                    design_counter += 1
-                ### added in v5 to only keep points that in color code "keep_point" category
-                elif line["aci"] in keep_point_colors and line["entity_type"] == "POINT":
-                    outline_points.append(points)
-                ###
-                ### added in v7 to support electric
-                elif line["aci"] in electric_colors:
-                    electric_aci = line["aci"]
-                    electric = Designs.Electric(points, aci_color_code_dict[electric_aci])
-                    electric_objs.append(electric)
-                ###
-
-
-    # all_points = [("outline_points", outline_points), ("inside_points", inside_points), ("ignore_points", ignore_points)]
-    # for points in all_points:
-    #     print(f"\n++++++++++ {points[0]} ++++++++++")
-    #     for i, points_group in enumerate(points[1]):
-    #         print(f"group {i+1}:")
-    #         for point in points_group:
-    #             print(point)
-
-    return outline_points, inside_points, ignore_points
-
 def parse_simple_data(data):
     all_points = []
     for point in data:
@@ -218,6 +99,8 @@ def parse_simple_data(data):
     return all_points, []
 
 def view(points, draw_edges=True):
+    import matplotlib.pyplot as plt
+
     n = len(points)
     all_points = []
     for group in points:
@@ -244,7 +127,7 @@ def create_circlex_object(line): # v7
     circle_color = aci_color_code_dict[circle_aci]
     return Designs.Circle([circle_x,circle_y], circle_r, circle_color)
 
-def _create_electric_shapes_to_show(): # v7
+def _create_electric_shapes_to_show(electric_objs): # v7
     electric_shapes = []
     for electric in electric_objs:
         electric_shapes.append((electric.updated_points, electric.color))
@@ -254,8 +137,10 @@ def _create_electric_shapes_to_show(): # v7
 ###################################################### Smartscale ##########################################################################
 ############################################################################################################################################
 
-def draw_shapes(shapes, designs, circles=[], title="shapes", to_export=False):
-    shapes += _create_electric_shapes_to_show() # v7
+def draw_shapes(shapes, designs, circles=[], electrics=[], title="shapes", to_export=False):
+    import matplotlib.pyplot as plt
+
+    shapes += _create_electric_shapes_to_show(electrics) # v7
     fig, ax = plt.subplots()
     for shape in shapes:
         points, color = shape
@@ -276,7 +161,7 @@ def draw_shapes(shapes, designs, circles=[], title="shapes", to_export=False):
             plt.plot((point.x, next_point.x), (point.y, next_point.y), linestyle=linestyle, linewidth=linewidth, alpha=alpha, c=c, zorder=99)
 
     for design in designs:
-        ax.add_patch(design)
+        ax.add_patch(Designs.to_patch(design))
     
     for circle in circles:
         x, y = circle.get_center()
@@ -287,189 +172,279 @@ def draw_shapes(shapes, designs, circles=[], title="shapes", to_export=False):
 
     if to_export:
         plt.savefig(f"{title}.png")
+        plt.close(fig)
     else:
         plt.show()
     return
 
-def _extract_piece_points(source, index, destination, to_reverse):
-    if source and source[index]:
-        piece = source.pop(index)
-        if to_reverse:
-            piece.reverse()
-
-        # merge the two similar points' info
-        if destination:
-            common_point = piece.pop(0)
-            destination[-1]._info += common_point._info
-        
-        # copy all remaining points in order
-        for point in piece:
-            destination.append(point)
-    return
-
-def match_points(all_points):
-    if not all_points:
-        return []
-    _print_banner("Match Points")
-    # print(all_points)
-    result = []
-    _extract_piece_points(source=all_points, index=0, destination=result, to_reverse=False)
-    # print("++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")
-    # print(result)
-
-    had_match = True
-    while all_points and had_match:
-        last_point = result[-1] # search for new match with the last point of last matched piece
-        had_match = False # to ensure ach point find a match in each iteration
-        for i, piece in enumerate(all_points):
-            if piece[0] == last_point:
-                _extract_piece_points(source=all_points, index=i, destination=result, to_reverse=False)
-                had_match = True
-            elif piece[-1] == last_point:
-                _extract_piece_points(source=all_points, index=i, destination=result, to_reverse=True)
-                had_match = True
-    
-    if len(all_points) != 0 or result[0] != result[-1]:
-        # print("Error: not a closed shape")
-        raise RuntimeError("Error: not a closed shape")
-    
-    last_point = result.pop(-1)
-    result[0]._info += last_point._info
-    result[0]._color_code = last_point._color_code
-    return result
+def _exact_key(point):
+    return (point.x, point.y)
+
+class _SnapKeys:
+    """
+    Endpoint keys with a tolerance: a point gets the key (coordinates) of the first point
+    seen within tolerance of it, else its own. The grid cells are tolerance sized, so every
+    candidate lies in the point's cell or one of the 8 around it.
+    """
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self.cells = defaultdict(list) # grid cell -> representative points in it
+        self.keys = {}                 # coordinates -> key
+
+    def __call__(self, point):
+        xy = (point.x, point.y)
+        key = self.keys.get(xy)
+        if key is None:
+            key = self.keys[xy] = self._snap(xy)
+        return key
+
+    def _snap(self, xy):
+        cx, cy = math.floor(xy[X] / self.tolerance), math.floor(xy[Y] / self.tolerance)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for rep in self.cells.get((cx + dx, cy + dy), ()):
+                    if math.hypot(rep[X] - xy[X], rep[Y] - xy[Y]) <= self.tolerance:
+                        return rep
+        self.cells[(cx, cy)].append(xy)
+        return xy
+
+def _endpoint_keys(tolerance=None):
+    # exact coordinates by default, or endpoints snapped together within tolerance
+    return _SnapKeys(tolerance) if tolerance else _exact_key
+
+def _index_endpoints(all_points, endpoint_key):
+    ends = defaultdict(list)    # endpoint key -> pieces (LINE / LWPOLYLINE) starting or ending there
+    singles = defaultdict(list) # endpoint key -> single point pieces (keep_point POINTs) lying there
+    for i, piece in enumerate(all_points):
+        if not piece:
+            raise RuntimeError(f"Error: not a closed shape, piece {i} has no points")
+        if len(piece) == 1:
+            singles[endpoint_key(piece[0])].append(i)
+        else:
+            ends[endpoint_key(piece[0])].append(i)
+            ends[endpoint_key(piece[-1])].append(i)
 
-def _get_intersection_point(line1: tuple[Point, Point], line2: tuple[Point, Point]):
-    p1, p2 = line1
-    p3, p4 = line2
+    if not ends:
+        raise RuntimeError("Error: not a closed shape, no outline segments to match")
 
-    denom = (p1.x-p2.x)*(p3.y-p4.y) - (p1.y-p2.y)*(p3.x-p4.x)
-    if denom == 0:
-        # print("parallel lines")
-        return None
+    # in a closed outline every endpoint is shared by exactly two pieces
+    for key, pieces in ends.items():
+        point = all_points[pieces[0]][0] if endpoint_key(all_points[pieces[0]][0]) == key else all_points[pieces[0]][-1]
+        if len(pieces) == 1:
+            raise RuntimeError(f"Error: not a closed shape, unmatched endpoint {point.pprint()} of piece {pieces[0]}")
+        if len(pieces) > 2:
+            raise RuntimeError(f"Error: not a closed shape, branching endpoint {point.pprint()} shared by pieces {pieces}")
 
-    px = ((p1.x*p2.y - p1.y*p2.x)*(p3.x-p4.x) - (p1.x-p2.x)*(p3.x*p4.y - p3.y*p4.x)) / denom
-    py = ((p1.x*p2.y - p1.y*p2.x)*(p3.y-p4.y) - (p1.y-p2.y)*(p3.x*p4.y - p3.y*p4.x)) / denom
-    return (px, py)
+    for key, pieces in singles.items():
+        if key not in ends:
+            raise RuntimeError(f"Error: not a closed shape, point {all_points[pieces[0]][0].pprint()} is not on an outline endpoint")
 
-def _create_new_shape(shape, index, new_point1, new_point2):
-    n = shape.n
-    i1 = index
-    i2 = (index+1) % n
+    return ends, singles
 
-    # get the original points' info
-    new_point1._info = shape.points[i1]._info
-    new_point2._info = shape.points[i2]._info
+def _append_piece_points(piece, destination, to_reverse):
+    points = piece[::-1] if to_reverse else piece
 
-    new_point1._color_code = shape.points[i1]._color_code
-    new_point2._color_code = shape.points[i2]._color_code
+    # merge the two similar points' info
+    first = 0
+    if destination:
+        destination[-1]._info += points[0]._info
+        first = 1
 
-    # create a new shape with the new points
-    new_shape = shape.mcopy()
-    new_shape.change_point(index=i1, new_point=new_point1)
-    new_shape.change_point(index=i2, new_point=new_point2)
-    return new_shape
+    # copy all remaining points in order
+    destination.extend(points[first:])
+    return
 
-def move_edge(shape, p1_index, p2_index, delta):
-    points = shape.points
-    abs_delta = abs(delta)
-    n = shape.n
+def _chain_loop(all_points, ends, singles, used, first, endpoint_key):
+    # follows the shared endpoints from the piece first until the loop closes
+    result = []
+    _append_piece_points(all_points[first], result, to_reverse=False)
+    used[first] = True
 
-    p1 = points[p1_index % n]
-    p2 = points[p2_index % n]
+    while True:
+        key = endpoint_key(result[-1]) # search for new match with the last point of last matched piece
 
-    dx, dy = p2.x - p1.x, p2.y - p1.y
-    length = math.hypot(dx, dy)
-    if length == 0:
-        raise ValueError("not an edge")
+        # keep points lying on this vertex are consumed without merging their info,
+        # they are never written back and their index belongs to the next outline point
+        for i in singles.pop(key, []):
+            used[i] = True
 
-    # positive shape option
-    positive_normal = Point(-dy/length, dx/length)
-    p1_pos = p1 + positive_normal*abs_delta
-    p2_pos = p2 + positive_normal*abs_delta
-    positive_shape = _create_new_shape(shape=shape, index=p1_index, new_point1=p1_pos, new_point2=p2_pos)
+        next_pieces = [i for i in ends[key] if not used[i]]
+        if not next_pieces:
+            break
+        i = next_pieces[0]
+        piece = all_points[i]
+        _append_piece_points(piece, result, to_reverse=endpoint_key(piece[0]) != key)
+        used[i] = True
 
-    # negative shape option
-    negative_normal = Point(dy/length, -dx/length)
-    p1_neg = p1 + negative_normal*abs_delta
-    p2_neg = p2 + negative_normal*abs_delta
-    negative_shape = _create_new_shape(shape=shape, index=p1_index, new_point1=p1_neg, new_point2=p2_neg)
+    if endpoint_key(result[0]) != endpoint_key(result[-1]):
+        raise RuntimeError(f"Error: not a closed shape, outline ends at {result[-1].pprint()} instead of {result[0].pprint()}")
 
-    if delta >= 0:
-        return (p1_pos, p2_pos) if positive_shape.area > negative_shape.area else (p1_neg, p2_neg)
-    else:
-        return (p1_pos, p2_pos) if positive_shape.area < negative_shape.area else (p1_neg, p2_neg)
-
-def applay_edges_movements(shape, colors_shift_dict):
-    edges_after_moving = []
-    for i in range(shape.n):
-        # edge color is the secound point's color
-        j = (i+1) % shape.n
-        color_code = shape.points[j]._color_code
-        color = aci_color_code_dict[color_code]
-
-        # get the edge's shift according to it's color
-        shift = colors_shift_dict[color]
-
-        if shift != 0:
-            # applay the shift on the edge
-            # print(f"moving {color} Edge({i},{i+1}) by {shift}")
-            new_edge = move_edge(shape, i, (i+1), shift)
-            edges_after_moving.append(new_edge)
-        else:
-            # save the edge without change
-            edges_after_moving.append((shape.points[i], shape.points[j]))
-    
-    # print("\nedges_after_moving:")
-    for e in range(len(edges_after_moving)):
-        print(f"Edge {e} : {edges_after_moving[e]}")
+    last_point = result.pop(-1)
+    result[0]._info += last_point._info
+    result[0]._color_code = last_point._color_code
+    return result
 
-    return edges_after_moving
+def match_loops(all_points, tolerance=None):
+    """
+    Chains the outline pieces into closed loops by following the shared endpoints, for
+    drawings with several outlines (rooms, counters...) every connected component gets its
+    own loop. Pieces are indexed by their endpoints, so each step is a dict lookup instead of
+    a rescan of the remaining pieces. tolerance=None matches exact coordinates, otherwise
+    endpoints closer than tolerance are matched. Returns the loops in the order of their first piece.
+    """
+    if not all_points:
+        return []
+    _print_banner("Match Loops")
+    endpoint_key = _endpoint_keys(tolerance)
+    ends, singles = _index_endpoints(all_points, endpoint_key)
+
+    used = [False] * len(all_points)
+    loops = []
+    for first, piece in enumerate(all_points):
+        if not used[first] and len(piece) > 1:
+            loops.append(_chain_loop(all_points, ends, singles, used, first, endpoint_key))
+    return loops
+
+def _shape_to_array(shape):
+    return np.array([(point.x, point.y) for point in shape.points], dtype=float)
+
+def _edges_shifts(shape, colors_shift_dict):
+    # edge i goes from point i to point i+1, the edge color is the secound point's color
+    n = shape.n
+    return np.array([colors_shift_dict[aci_color_code_dict[shape.points[(i+1) % n]._color_code]] for i in range(n)], dtype=float)
+
+def _signed_area(vertices):
+    # twice the signed area of the polygon, its sign is the orientation
+    next_vertices = np.roll(vertices, -1, axis=0)
+    return np.sum(vertices[:, X] * next_vertices[:, Y] - next_vertices[:, X] * vertices[:, Y])
+
+def offset_edges(vertices, shifts, edges=None, signed_area=None):
+    """
+    Moves every edge of the polygon along its normal by its shift at once.
+    vertices is an (n,2) array, edge i goes from vertex i to vertex i+1. shifts holds one
+    shift per edge, (n,) or (..., n) to offset several shift configurations together.
+    A positive shift moves the edge to the side that grows the polygon's area, a negative
+    one to the side that shrinks it. Returns the moved edges' (..., n, 2) starts and ends.
+    edges limits the work to those edge indices, shifts then holds one shift per listed edge.
+    """
+    n = len(vertices)
+    edges = np.arange(n) if edges is None else np.asarray(edges, dtype=int)
+    shifts = np.asarray(shifts, dtype=float)
+    if signed_area is None:
+        signed_area = _signed_area(vertices)
+
+    p1 = vertices[edges]
+    p2 = vertices[(edges+1) % n]
+    d = p2 - p1
+    length = np.hypot(d[:, X], d[:, Y])
+
+    moving = shifts != 0
+    if np.any(moving & (length == 0)):
+        raise ValueError("not an edge")
 
-def connect_edges(edges):
-    n = len(edges)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        positive_normal = np.stack((-d[:, Y] / length, d[:, X] / length), axis=1)
+
+    # moving the edge i by v changes twice the signed area by cross(p[i-1] + p[i] - p[i+1] - p[i+2], v)
+    w = vertices[(edges-1) % n] + p1 - p2 - vertices[(edges+2) % n]
+    growth = w[:, X] * positive_normal[:, Y] - w[:, Y] * positive_normal[:, X]
+    grows = np.where(signed_area * growth > 0, 1.0, -1.0)   # side to grow the area
+    shrinks = np.where(signed_area * growth < 0, 1.0, -1.0) # side to shrink the area
+    side = np.where(shifts >= 0, grows, shrinks)
+
+    offset = positive_normal * np.abs(shifts)[..., None] * side[..., None]
+    offset = np.where(moving[..., None], offset, 0.0)
+    return p1 + offset, p2 + offset
+
+def connect_edges(starts, ends, corners=None):
+    """
+    Intersects every edge with the next one, all the 2x2 line systems are solved together
+    (Cramer's rule). Point k of the result is the intersection of edges k and k+1.
+    corners limits the work to those k, starts and ends still hold all the edges.
+    """
+    n = starts.shape[-2]
+    corners = np.arange(n) if corners is None else np.asarray(corners, dtype=int)
+    following = (corners+1) % n
+
+    x1, y1 = starts[..., corners, X], starts[..., corners, Y]
+    x2, y2 = ends[..., corners, X], ends[..., corners, Y]
+    x3, y3 = starts[..., following, X], starts[..., following, Y]
+    x4, y4 = ends[..., following, X], ends[..., following, Y]
+
+    denom = (x1-x2)*(y3-y4) - (y1-y2)*(x3-x4)
+    if np.any(denom == 0):
+        i = int(corners[np.argwhere(denom == 0)[0][-1]])
+        raise RuntimeError(f"Error: edges {i} and {(i+1) % n} are parallel, cannot connect them")
+
+    a = x1*y2 - y1*x2
+    b = x3*y4 - y3*x4
+    px = (a*(x3-x4) - (x1-x2)*b) / denom
+    py = (a*(y3-y4) - (y1-y2)*b) / denom
+    return np.stack((px, py), axis=-1)
+
+def _shifted_shape(shape, new_vertices):
+    # copy the original Shape's info into the new Shape
+    # (new point j is the intersection of edges j and j+1, it replaces the original point j+1)
     points = []
-    # print("\nconnecting the new edges:")
-    for i in range(n):
-        j = (i+1) % n
-        intersection_point = _get_intersection_point(edges[i], edges[j])
-        # print(f"intersection_point {i},{j} : {intersection_point}")
-        point = Point(intersection_point[X], intersection_point[Y])
-        points.append(point)
+    for j in range(shape.n):
+        i = (j+1) % shape.n
+        point = shape.points[i]
+        points.append(Point(float(new_vertices[j, X]), float(new_vertices[j, Y]), point._info, point._color_code))
 
     return Shape(points)
 
-def smartscale(shape, shifts):
-    _print_banner("Moving Edges")
-    edges = applay_edges_movements(shape, shifts)
-    new_shape = connect_edges(edges)
-
-    # copy the original Shape's info into the new Shape
-    for i in range(shape.n):
-        j = (i-1) % shape.n
-        new_shape.points[j]._info = shape.points[i]._info
-        new_shape.points[j]._color_code = shape.points[i]._color_code
-
-    return new_shape
+def _shift_loop(vertices, edges_shifts):
+    # offset edges and new vertices of one loop, module level so the loops pool can run it
+    starts, ends = offset_edges(vertices, edges_shifts)
+    return starts, ends, connect_edges(starts, ends)
+
+_loops_pool = None
+_loops_pool_lock = threading.Lock()
+
+def _get_loops_pool():
+    global _loops_pool
+    with _loops_pool_lock:
+        if _loops_pool is None:
+            # spawned, forking a server process with running threads can deadlock the workers
+            _loops_pool = ProcessPoolExecutor(max_workers=shift_pool_workers, mp_context=multiprocessing.get_context("spawn"))
+        return _loops_pool
+
+def shutdown():
+    # stops the loops pool, if it was ever started
+    global _loops_pool
+    with _loops_pool_lock:
+        if _loops_pool is not None:
+            _loops_pool.shutdown(wait=False, cancel_futures=True)
+            _loops_pool = None
+
+def shift_loops(vertices_list, edges_shifts_list):
+    """
+    _shift_loop for every loop. A loop is a single vectorized pass, so they run inline
+    unless there are at least shift_pool_min_loops of them, then they are spread in
+    chunks over a process pool (SHIFT_POOL_WORKERS, created on first use). Inside a pool
+    worker (batch, DXF_EXECUTOR=process...) they always run inline, the cpus are already
+    taken by that pool.
+    Returns a (starts, ends, new_vertices) tuple per loop.
+    """
+    if len(vertices_list) < shift_pool_min_loops or multiprocessing.parent_process() is not None:
+        return [_shift_loop(vertices, edges_shifts) for vertices, edges_shifts in zip(vertices_list, edges_shifts_list)]
+
+    workers = shift_pool_workers or os.cpu_count() or 1
+    chunksize = max(1, len(vertices_list) // (4 * workers))
+    return list(_get_loops_pool().map(_shift_loop, vertices_list, edges_shifts_list, chunksize=chunksize))
 
 ############################################################################################################################################
 ###################################################### Write Back ##########################################################################
 ############################################################################################################################################
 
-def update_circles(circles_list): # v7
-    # print(f"\nupdating {len(circles_list)} circle" + "s" if len(circles_list) != 1 else "")
-
-    for circle in circles_list:
-        new_radius = colors_shift_dict[circle.get_color()]
-        circle.set_radius(new_radius)
-    return
-
-def update_electric(electric_list): # v7
-    # print(f"\nupdating {len(electric_list)} electric" + "s" if len(electric_list) != 1 else "")
+def _colors_shift_dict(shifts):
+    colors_shift_dict = dict(default_colors_shift_dict)
+    for color, shitf, code in shifts:
+        colors_shift_dict[aci_color_code_dict[color]] = shitf
+    return colors_shift_dict
 
-    for electric in electric_list:
-        measures_str = colors_shift_dict[electric.get_color()]
-        electric.calculate_points(measures_str)
-    return
+def _colors_categories(shifts):
+    return {(color, code) for color, shitf, code in shifts}
 
 def _create_data_sequence(points):
     max_index = 0
@@ -483,148 +458,508 @@ def _create_data_sequence(points):
     
     return sequence
 
-def _update_data(data, sequence):
-    _print_banner("Write Back The Updated Data")
-    counter = 0
-    circles_counter = 0
-    electric_counter = 0
+############################################################################################################################################
+##################################################### Shift Session ########################################################################
+############################################################################################################################################
 
-    # if "coordinates" in data:
-    for line in data:
-        if "entity_type" in line and "layer" in line and "aci" in line:
-            if line["entity_type"].upper() in valide_entity_types and line["layer"] != "Frames":
+class ShiftSession:
+    """
+    Holds all the state of a single shift run (colors categories, shifts per color,
+    circles, electric and design parts), so the engine module is imported once and
+    every request works on its own session instead of shared module globals.
+
+    The session runs headless: nothing goes through pyplot unless debug_dir is given,
+    in which case the diagnostic shapes image is rendered into that directory.
+    With a cache (cache.geometry_cache) the parsed & matched geometry is reused by
+    the next sessions that get the same data and color categories.
+    tolerance matches outline endpoints closer than it (SHIFT_MATCH_TOLERANCE by default).
+    """
+    def __init__(self, debug_dir=debug_render_dir, cache=None, tolerance=shift_match_tolerance):
+        self.debug_dir = debug_dir
+        self.cache = cache
+        self.tolerance = tolerance
+        self.colors_shift_dict = dict(default_colors_shift_dict)
+
+        self.outline_colors    = []
+        self.inside_colors     = []
+        self.ignore_colors     = []
+        self.remove_colors     = []
+        self.keep_point_colors = []
+        self.circles_colors    = []
+        self.electric_colors   = []
+
+        self.design_parts  = [] # (index in ignore_points, design category)
+        self.electric_objs = [] # v7
+        self.circles_objs  = [] # v7
+
+        self.result = None # last run() output, kept up to date by reshift()
+        self._lock = threading.Lock()
+        return
+
+    # divides the colors into 7 lists according to the categories code from shifts
+    # and fills colors_shift_dict with the shift amount for each color
+    def _parse_colors_list(self, shifts):
+        # _print_banner("Colors & Shitfs")
+        categories = ["outline", "inside", "ignore", "remove", "keep_point", "circles", "electric"]
+        lists = [self.outline_colors, self.inside_colors, self.ignore_colors, self.remove_colors, self.keep_point_colors, self.circles_colors, self.electric_colors]
+
+        for line in shifts:
+            color, shitf, code = line
+            # print(f"code={code}")
+            self.colors_shift_dict[aci_color_code_dict[color]] = shitf
+            ### added in v6 to support sink, gas and electric ignore
+            list_type = 2 if code in ignore_codes else code-1
+            ###
+            ### added in v7 to support circles and electric
+            if code == categories_to_code_dict["electric_cr"]:
+                list_type = 5 # add to circles_colors list
+            elif code == categories_to_code_dict["electric_sq"]:
+                list_type = 6 # add to electric_colors list
+            ###
+            lists[list_type].append(color)
+
+        for i in range(len(lists)):
+            # print(f"\n{categories[i]} colors list:")
+            for color in lists[i]:
+                shitf = self.colors_shift_dict[aci_color_code_dict[color]]
+                # if isinstance(shitf, str): # v7 - electric
+                #     # print(f"{aci_color_code_dict[color]} ({shitf})")
+                # else:
+                #     # print(f"{aci_color_code_dict[color]} ({('+' if shitf > 0 else '') + str(shitf)})")
+
+        return
+
+    def parse_data(self, data, to_print=False):
+        _print_banner("Parse Data")
+        outline_points = []
+        inside_points = []
+        ignore_points = []
+        counter = 0
+        design_counter = 0 # to keep track of sync, gas, electric...
+        # if "coordinates" in data:
+        for line in data:
+            if "entity_type" in line and "layer" in line and "aci" in line:
+                if line["entity_type"].upper() in valide_entity_types and line["layer"] != "Frames":
+
+                    ### added in v5 to only keep points that in color code "keep_point" category
+                    if (line["entity_type"] == "POINT") and (line["aci"] not in self.keep_point_colors):
+                        continue
+                    ###
+
+                    ### added in v7 to support circles
+                    if line["entity_type"] == "CIRCLE":
+                        if line["aci"] in self.circles_colors:
+                            if "center" in line and "radius" in line:
+                                # the circle is valide and need change
+                                # if to_print:
+                                #     print("circle detected!f")
+                                circle = create_circlex_object(line)
+                                self.circles_objs.append(circle)
+
+                        # skip points parsing for circle entity
+                        continue
+                    ###
+
+                    for design_category in design_categories.keys():
+                        if design_category in line["layer"]:
+                            self.design_parts.append((design_counter, design_category))
+
+                    vertices = _parse_line(line)
+                    # if to_print:
+                        # print("###############################################################################################")
+                        # print(line["entity_type"])
+                        # print(vertices)
 
-                ### added in v5 to only keep points that in color code "keep_point" category
-                if (line["entity_type"] == "POINT") and (line["aci"] not in keep_point_colors):
-                    continue
-                ###
-
-                ### added in v7 to support circles
-                if line["entity_type"] == "CIRCLE":
-                    if line["aci"] in circles_colors:
-                        if "center" in line and "radius" in line:
-                            # the circle is valide and need update
-                            if circles_counter >= len(circles_objs):
-                                # print("Error: missing circles to write back")
-                                raise RuntimeError("Error: missing circles to write back")
-                            else:
-                                line["radius"] = circles_objs[circles_counter].get_radius()
-                                circles_counter += 1
+                    to_incease_counter = True if line["aci"] in self.outline_colors or line["aci"] in self.inside_colors else False
 
-                    # skip points updating for circle entity
-                    continue
-                ###
+                    points = []
+                    for point in vertices:
+                        # if to_print:
+                        #     print(point)
 
-                vertices = _parse_line(line)
+                        if "x" in point and "y" in point:
+                            # points.append(Point(round(point["x"]), round(point["y"]), info=[counter], color=line["aci"])) # v6R - ignore
+                            points.append(Point(point["x"], point["y"], info=[counter], color=line["aci"])) # v6
+                            # if to_print:
+                            #     print(f"created {points[-1]}")
+                            if to_incease_counter:
+                                counter += 1
+
+                    if line["aci"] in self.outline_colors:
+                        outline_points.append(points)
+                    elif line["aci"] in self.inside_colors:
+                        inside_points.append(points)
+                    elif line["aci"] in self.ignore_colors:
+                        ignore_points.append(points)
+                        design_counter += 1
+                    ### added in v5 to only keep points that in color code "keep_point" category
+                    elif line["aci"] in self.keep_point_colors and line["entity_type"] == "POINT":
+                        outline_points.append(points)
+                    ###
+                    ### added in v7 to support electric
+                    elif line["aci"] in self.electric_colors:
+                        electric_aci = line["aci"]
+                        electric = Designs.Electric(points, aci_color_code_dict[electric_aci])
+                        self.electric_objs.append(electric)
+                    ###
+
+
+        # all_points = [("outline_points", outline_points), ("inside_points", inside_points), ("ignore_points", ignore_points)]
+        # for points in all_points:
+        #     print(f"\n++++++++++ {points[0]} ++++++++++")
+        #     for i, points_group in enumerate(points[1]):
+        #         print(f"group {i+1}:")
+        #         for point in points_group:
+        #             print(point)
+
+        return outline_points, inside_points, ignore_points
+
+    def update_circles(self, circles_list, colors_shift_dict=None): # v7
+        # print(f"\nupdating {len(circles_list)} circle" + "s" if len(circles_list) != 1 else "")
+        if colors_shift_dict is None:
+            colors_shift_dict = self.colors_shift_dict
+
+        for circle in circles_list:
+            new_radius = colors_shift_dict[circle.get_color()]
+            circle.set_radius(new_radius)
+        return
+
+    def update_electric(self, electric_list, colors_shift_dict=None): # v7
+        # print(f"\nupdating {len(electric_list)} electric" + "s" if len(electric_list) != 1 else "")
+        if colors_shift_dict is None:
+            colors_shift_dict = self.colors_shift_dict
+
+        for electric in electric_list:
+            measures_str = colors_shift_dict[electric.get_color()]
+            electric.calculate_points(measures_str)
+        return
+
+    def _update_data(self, data, sequence):
+        _print_banner("Write Back The Updated Data")
+        counter = 0
+        circles_counter = 0
+        electric_counter = 0
+
+        # if "coordinates" in data:
+        for line in data:
+            if "entity_type" in line and "layer" in line and "aci" in line:
+                if line["entity_type"].upper() in valide_entity_types and line["layer"] != "Frames":
+
+                    ### added in v5 to only keep points that in color code "keep_point" category
+                    if (line["entity_type"] == "POINT") and (line["aci"] not in self.keep_point_colors):
+                        continue
+                    ###
+
+                    ### added in v7 to support circles
+                    if line["entity_type"] == "CIRCLE":
+                        if line["aci"] in self.circles_colors:
+                            if "center" in line and "radius" in line:
+                                # the circle is valide and need update
+                                if circles_counter >= len(self.circles_objs):
+                                    # print("Error: missing circles to write back")
+                                    raise RuntimeError("Error: missing circles to write back")
+                                else:
+                                    line["radius"] = self.circles_objs[circles_counter].get_radius()
+                                    circles_counter += 1
+
+                        # skip points updating for circle entity
+                        continue
+                    ###
+
+                    vertices = _parse_line(line)
+
+                    ### added in v7 to support electric
+                    if line["aci"] in self.electric_colors:
+                        if len(vertices) != 4:
+                            # print("Error: incorrect electric entity")
+                            raise RuntimeError("Error: incorrect electric entity")
+                        for point in vertices:
+                            if not ("x" in point and "y" in point):
+                                # print("Error: incorrect electric point")
+                                raise RuntimeError("Error: incorrect electric point")
+                        if electric_counter >= len(self.electric_objs):
+                            # print("Error: missing electric to write back")
+                            raise RuntimeError("Error: missing electric to write back")
+
+
+                        updated_electric_points = self.electric_objs[electric_counter].updated_points
+                        for i, point in enumerate(vertices):
+                            point["x"] = updated_electric_points[i].x
+                            point["y"] = updated_electric_points[i].y
+
+                        # skip points updating for electric entity
+                        electric_counter += 1
+                        continue
+                    ###
 
-                ### added in v7 to support electric
-                if line["aci"] in electric_colors:
-                    if len(vertices) != 4:
-                        # print("Error: incorrect electric entity")
-                        raise RuntimeError("Error: incorrect electric entity")
                     for point in vertices:
-                        if not ("x" in point and "y" in point):
-                            # print("Error: incorrect electric point")
-                            raise RuntimeError("Error: incorrect electric point")
-                    if electric_counter >= len(electric_objs):
-                        # print("Error: missing electric to write back")
-                        raise RuntimeError("Error: missing electric to write back")
-
-                    
-                    updated_electric_points = electric_objs[electric_counter].updated_points
-                    for i, point in enumerate(vertices):
-                        point["x"] = updated_electric_points[i].x
-                        point["y"] = updated_electric_points[i].y
-
-                    # skip points updating for electric entity
-                    electric_counter += 1
+                        if "x" in point and "y" in point and (line["aci"] in self.outline_colors or line["aci"] in self.inside_colors):
+                            if counter < len(sequence):
+                                point["x"] = sequence[counter][X]
+                                point["y"] = sequence[counter][Y]
+                                counter += 1
+                            else:
+                                # print("Error: too many points to write back")
+                                raise RuntimeError("Error: too many points to write back")
+        # print("\n" + "All Points Updated Successfully!" if counter == len(sequence) else "Error: did not write all points back")
+        return data
+
+    ### use in case of outlines only ###
+    def write_back(self, path, shape):
+        # read data from json file
+        with open(path, "r") as f:
+            data = json.load(f)
+
+        # update the data according to the given shape
+        sequence = _create_data_sequence(shape.points)
+        self._update_data(data, sequence)
+
+        # write the new data back to the json file
+        new_path = path.split(".json")
+        name = new_path[0] + "_output.json"
+        with open(name, "w") as f:
+            json.dump(data, f, indent=2)
+        return
+
+    def prepare(self, data, shifts):
+        _print_logo()
+
+        # save the info in colors_shift_dict and the 4 color categories lists
+        self._parse_colors_list(shifts)
+
+        # reuse the geometry of an identical previous request
+        key = None
+        if self.cache is not None:
+            key = geometry_key(data, shifts, self.tolerance)
+            geometry = self.cache.get(key)
+            if geometry is not None:
+                self._load_geometry(geometry)
+                return
+
+        # split the points from the data by color category
+        outline_points, inside_points, ignore_points = self.parse_data(data)
+        self.ignore_points = ignore_points
+
+        # to view json without any operaions
+        # view(outline_points, draw_edges=False)
+
+        # create the outline shapes, one per closed loop
+        self.shapes = [Shape(points) for points in match_loops(outline_points, self.tolerance)]
+
+        # create the inner shapes (if exist)
+        self.inside_shapes = [Shape(points) for points in inside_points]
+
+        # create the sync, gas and electric designs
+        self.all_designs = []
+        for design_part in self.design_parts:
+            index, design_type = design_part
+            design_obj = design_categories[design_type](ignore_points[index])
+            self.all_designs += design_obj.designs
+
+        if self.cache is not None:
+            self.cache.set(key, self._geometry())
+        return
+
+    def _geometry(self):
+        # everything prepare() builds, circles and electric are saved as plain values
+        # since _finish() updates them in place
+        return {
+            "shapes": self.shapes,
+            "inside_shapes": self.inside_shapes,
+            "ignore_points": self.ignore_points,
+            "design_parts": list(self.design_parts),
+            "all_designs": list(self.all_designs),
+            "circles": [(circle.center, circle.radius, circle.color) for circle in self.circles_objs],
+            "electrics": [(electric.points, electric.color) for electric in self.electric_objs],
+        }
+
+    def _load_geometry(self, geometry):
+        self.shapes = geometry["shapes"]
+        self.inside_shapes = geometry["inside_shapes"]
+        self.ignore_points = geometry["ignore_points"]
+        self.design_parts = list(geometry["design_parts"])
+        self.all_designs = list(geometry["all_designs"])
+        self.circles_objs = [Designs.Circle(center, radius, color) for center, radius, color in geometry["circles"]]
+        self.electric_objs = [Designs.Electric(points, color) for points, color in geometry["electrics"]]
+        return
+
+    def _finish(self, data, new_shapes):
+        # v7 - update circles and electric objects before drawing and updating the json data file
+        self.update_circles(self.circles_objs)
+        self.update_electric(self.electric_objs)
+
+        # draw the outlines, inner points and extras (debug mode only)
+        if self.debug_dir:
+            shapes = [(shape.points, "black") for shape in self.shapes] + [(shape.points, None) for shape in new_shapes + self.inside_shapes]
+            extras = [(e, None) for e in self.ignore_points]
+            os.makedirs(self.debug_dir, exist_ok=True)
+            draw_shapes(shapes + extras, self.all_designs,
+                        self.circles_objs, self.electric_objs, os.path.join(self.debug_dir, "test_100"), to_export=True)
+
+        # update the original json data file, all the loops and inner shapes go through one sequence
+        points = [point for shape in new_shapes + self.inside_shapes for point in shape.points]
+        sequence = _create_data_sequence(points)
+        updated_data = self._update_data(data, sequence)
+        cleaned = [{k: v for k, v in obj.items() if v is not None} for obj in updated_data]
+        return cleaned
+
+    def run(self, data, shifts):
+        self.prepare(data, shifts)
+
+        # applay the shifts on every outline loop, the per loop arrays are kept for reshift()
+        _print_banner("Moving Edges")
+        self.categories = _colors_categories(shifts)
+        self.vertices = [_shape_to_array(shape) for shape in self.shapes]
+        self.edges_shifts = [_edges_shifts(shape, self.colors_shift_dict) for shape in self.shapes]
+        shifted = shift_loops(self.vertices, self.edges_shifts)
+        self.starts = [starts for starts, ends, new_vertices in shifted]
+        self.ends = [ends for starts, ends, new_vertices in shifted]
+        self.new_vertices = [new_vertices for starts, ends, new_vertices in shifted]
+        new_shapes = [_shifted_shape(shape, new_vertices) for shape, new_vertices in zip(self.shapes, self.new_vertices)]
+
+        self.result = self._finish(data, new_shapes)
+        self._slots = None
+        return self.result
+
+    def _data_slots(self):
+        # same walk as _update_data(): where every written point counter lives in the data
+        # (entity index, vertex index), and the entity indices of the circles and electric
+        points, circles, electrics = [], [], []
+        for e, line in enumerate(self.result):
+            if "entity_type" in line and "layer" in line and "aci" in line:
+                if line["entity_type"].upper() in valide_entity_types and line["layer"] != "Frames":
+                    if (line["entity_type"] == "POINT") and (line["aci"] not in self.keep_point_colors):
+                        continue
+                    if line["entity_type"] == "CIRCLE":
+                        if line["aci"] in self.circles_colors and "center" in line and "radius" in line:
+                            circles.append(e)
+                        continue
+                    vertices = _parse_line(line)
+                    if line["aci"] in self.electric_colors:
+                        electrics.append(e)
+                        continue
+                    if line["aci"] in self.outline_colors or line["aci"] in self.inside_colors:
+                        points += [(e, v) for v, point in enumerate(vertices) if "x" in point and "y" in point]
+        return points, circles, electrics
+
+    def reshift(self, shifts):
+        """
+        Re-applies new shift values on the result of run(). Only the edges whose color shift
+        changed are offset again and only their two corners are re-intersected.
+        The colors must keep the categories of the run. self.result is updated in place and
+        the returned delta lists what moved:
+            vertices - {"entity", "vertex", "x", "y"} per moved point
+            circles  - {"entity", "radius"} per circle of a changed color
+            electric - {"entity", "vertices"} per electric of a changed color
+        """
+        if self.result is None:
+            raise RuntimeError("Error: nothing to reshift, run the session first")
+        if _colors_categories(shifts) != self.categories:
+            raise ValueError("Error: reshift must give the colors the same categories as the run")
+
+        with self._lock:
+            colors_shift_dict = _colors_shift_dict(shifts)
+
+            # everything is computed before the session state is touched, a failing reshift leaves it as it was
+            loops = [] # (loop, edges shifts, starts, ends, corners, corner vertices) per loop with changed edges
+            for loop, (shape, vertices) in enumerate(zip(self.shapes, self.vertices)):
+                edges_shifts = _edges_shifts(shape, colors_shift_dict)
+                changed = np.flatnonzero(edges_shifts != self.edges_shifts[loop])
+                if not changed.size:
                     continue
-                ###
-
-                for point in vertices:
-                    if "x" in point and "y" in point and (line["aci"] in outline_colors or line["aci"] in inside_colors):
-                        if counter < len(sequence):
-                            point["x"] = sequence[counter][X]
-                            point["y"] = sequence[counter][Y]
-                            counter += 1
-                        else:
-                            # print("Error: too many points to write back")
-                            raise RuntimeError("Error: too many points to write back")
-    # print("\n" + "All Points Updated Successfully!" if counter == len(sequence) else "Error: did not write all points back")
-    return data
-
-### use in case of outlines only ###
-def write_back(path, shape):
-    # read data from json file
-    with open(path, "r") as f:
-        data = json.load(f)
-
-    # update the data according to the given shape
-    sequence = _create_data_sequence(shape.points)
-    _update_data(data, sequence)
-
-    # write the new data back to the json file
-    new_path = path.split(".json")
-    name = new_path[0] + "_output.json"
-    with open(name, "w") as f:
-        json.dump(data, f, indent=2)
-    return
+                n = len(vertices)
+                starts, ends = self.starts[loop].copy(), self.ends[loop].copy()
+                starts[changed], ends[changed] = offset_edges(vertices, edges_shifts[changed], changed, _signed_area(vertices))
+                corners = np.unique(np.concatenate(((changed-1) % n, changed)))
+                loops.append((loop, edges_shifts, starts, ends, corners, connect_edges(starts, ends, corners)))
+
+            # the changed circles and electric are updated on copies, swapped in at the end
+            changed_colors = {color for color, shitf in colors_shift_dict.items() if self.colors_shift_dict.get(color) != shitf}
+            circles_objs = [copy.copy(circle) if circle.get_color() in changed_colors else circle for circle in self.circles_objs]
+            electric_objs = [copy.copy(electric) if electric.get_color() in changed_colors else electric for electric in self.electric_objs]
+            changed_circles = [new for new, old in zip(circles_objs, self.circles_objs) if new is not old]
+            changed_electrics = [new for new, old in zip(electric_objs, self.electric_objs) if new is not old]
+            self.update_circles(changed_circles, colors_shift_dict)
+            self.update_electric(changed_electrics, colors_shift_dict)
+
+            slots = self._slots if self._slots is not None else self._data_slots()
+            point_slots, circle_slots, electric_slots = slots
+
+            # the writes into self.result are collected too, (dict, key, value) each
+            delta = {"vertices": [], "circles": [], "electric": []}
+            writes = []
+            for loop, edges_shifts, starts, ends, corners, corner_vertices in loops:
+                moved = np.any(corner_vertices != self.new_vertices[loop][corners], axis=1)
+                shape = self.shapes[loop]
+                for k, vertex in zip(corners[moved], corner_vertices[moved]):
+                    # new point k replaces the original point k+1, see _shifted_shape()
+                    x, y = float(vertex[X]), float(vertex[Y])
+                    for index in shape.points[(k+1) % shape.n]._info:
+                        e, v = point_slots[index]
+                        point = _parse_line(self.result[e])[v]
+                        writes += [(point, "x", x), (point, "y", y)]
+                        delta["vertices"].append({"entity": e, "vertex": v, "x": x, "y": y})
+
+            for e, circle, old in zip(circle_slots, circles_objs, self.circles_objs):
+                if circle is not old:
+                    writes.append((self.result[e], "radius", circle.get_radius()))
+                    delta["circles"].append({"entity": e, "radius": circle.get_radius()})
+
+            for e, electric, old in zip(electric_slots, electric_objs, self.electric_objs):
+                if electric is not old:
+                    vertices = _parse_line(self.result[e])
+                    for point, updated in zip(vertices, electric.updated_points):
+                        writes += [(point, "x", updated.x), (point, "y", updated.y)]
+                    delta["electric"].append({"entity": e, "vertices": [{"x": p.x, "y": p.y} for p in electric.updated_points]})
+
+            # nothing failed, commit the new state to the session
+            self.colors_shift_dict = colors_shift_dict
+            self.circles_objs, self.electric_objs = circles_objs, electric_objs
+            self._slots = slots
+            for loop, edges_shifts, starts, ends, corners, corner_vertices in loops:
+                self.edges_shifts[loop], self.starts[loop], self.ends[loop] = edges_shifts, starts, ends
+                self.new_vertices[loop][corners] = corner_vertices
+            for target, field, value in writes:
+                target[field] = value
+
+        return delta
+
+    def sweep(self, data, shifts_list):
+        """
+        Shifts the same data with several shift configurations. The data is parsed and
+        the outline matched once, the configurations may only differ in their shift values.
+        Returns one updated data list per configuration.
+        """
+        if not shifts_list:
+            raise ValueError("Error: no shift configurations to sweep")
+        categories = _colors_categories(shifts_list[0])
+        for shifts in shifts_list[1:]:
+            if _colors_categories(shifts) != categories:
+                raise ValueError("Error: all shift configurations must give the same colors the same categories")
+
+        self.prepare(data, shifts_list[0])
+
+        # applay all the configurations on every outline loop together
+        _print_banner("Moving Edges")
+        configs = [_colors_shift_dict(shifts) for shifts in shifts_list]
+        vertices = [_shape_to_array(shape) for shape in self.shapes]
+        edges_shifts = [np.stack([_edges_shifts(shape, config) for config in configs]) for shape in self.shapes]
+        shifted = shift_loops(vertices, edges_shifts)
+
+        results = []
+        for c, colors_shift_dict in enumerate(configs):
+            self.colors_shift_dict = colors_shift_dict
+            new_shapes = [_shifted_shape(shape, new_vertices[c]) for shape, (starts, ends, new_vertices) in zip(self.shapes, shifted)]
+            results.append(self._finish(copy.deepcopy(data), new_shapes))
+        return results
 
 
 ############################################################################################################################################
 ######################################################### MAIN #############################################################################
 ############################################################################################################################################
 
-def main(data, shifts):
-    _print_logo()
-
-    # save the info in colors_shift_dict and the 4 color categories lists
-    _parse_colors_list(shifts)
-
-    # split the points from the data by color category
-    outline_points, inside_points, ignore_points = parse_data(data)
-
-    # to view json without any operaions
-    # view(outline_points, draw_edges=False)
-
-    # create the outline shape
-    points = match_points(outline_points)
-    shape = Shape(points)
-    shape.show()
-    
-    # create the inner shape (if exists)
-    # print(f"\ninside_shape {inside_points}")
-    inside_shape = None
-    if inside_points:
-        inside_shape = Shape(inside_points[0])
-        # print(f"inside_shape {inside_shape.points}")
-        inside_shape.show()
-
-    # applay the shifts on the outline shape
-    new_shape = smartscale(shape, colors_shift_dict)
-    
-    # create the sync, gas and electric designs
-    all_designs = []
-    for design_part in design_parts:
-        index, design_type = design_part
-        design_obj = design_categories[design_type](ignore_points[index])
-        all_designs += design_obj.designs
-
-    # v7 - update circles and electric objects before drawing and updating the json data file
-    # print("electric_objs")
-    # print(electric_objs)
-    update_circles(circles_objs)
-    update_electric(electric_objs)
-
-    # draw the outlines, inner points and extras
-    extras = [(e, None) for e in ignore_points]
-    inside_shape_points = inside_shape.points if inside_shape else []
-    draw_shapes([(shape.points, "black"), (new_shape.points, None), (inside_shape_points, None)] + extras, all_designs, circles_objs, "test_100")
-    
-    # update the original json data file
-    sequence = _create_data_sequence(new_shape.points + inside_shape_points)
-    updated_data = _update_data(data, sequence)
-    cleaned = [{k: v for k, v in obj.items() if v is not None} for obj in updated_data]
-    return cleaned
-
+def main(data, shifts, tolerance=shift_match_tolerance):
+    return ShiftSession(tolerance=tolerance).run(data, shifts)
 
+def sweep(data, shifts_list, tolerance=shift_match_tolerance):
+    return ShiftSession(tolerance=tolerance).sweep(data, shifts_list)
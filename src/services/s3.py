@@ -1,5 +1,10 @@
+import io
+import os
+import threading
 import boto3
-import uuid
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 REGION = "nyc3"  # Replace with your region
 ENDPOINT_URL = "https://nyc3.digitaloceanspaces.com"
@@ -8,28 +13,75 @@ SECRET_KEY = "KDPGqv2ZwVtvfTdw7EWLmOG2oVcThXMBXtrlue67Zxk"
 SPACE_NAME = "smartscale"
 SPACE_URI = "https://smartscale.nyc3.digitaloceanspaces.com"
 
-# Initialize client
-session = boto3.session.Session()
-client = session.client(
-    "s3",
-    region_name=REGION,
-    endpoint_url=ENDPOINT_URL,
-    aws_access_key_id=ACCESS_KEY,
-    aws_secret_access_key=SECRET_KEY,
-)
+# Connections kept open for concurrent uploads (the client is shared by all requests)
+MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", 32))
+MAX_ATTEMPTS = int(os.environ.get("S3_MAX_ATTEMPTS", 3))
 
+# Images are small, upload them in one request on the calling thread
+small_transfer = TransferConfig(use_threads=False, multipart_threshold=64 * 1024 * 1024)
 
-def upload_file(file_path):
-    file_name = f"dxf-draws/{uuid.uuid4()}.png"
+_client = None
+_client_lock = threading.Lock()
 
-    client.upload_file(
-        file_path,
+
+def get_client():
+    """
+    The shared client, created on first use so importing this module stays cheap (render workers...).
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            session = boto3.session.Session()
+            _client = session.client(
+                "s3",
+                region_name=REGION,
+                endpoint_url=ENDPOINT_URL,
+                aws_access_key_id=ACCESS_KEY,
+                aws_secret_access_key=SECRET_KEY,
+                config=Config(
+                    max_pool_connections=MAX_POOL_CONNECTIONS,
+                    retries={"max_attempts": MAX_ATTEMPTS, "mode": "standard"},
+                    connect_timeout=5,
+                    read_timeout=30,
+                    tcp_keepalive=True,
+                ),
+            )
+        return _client
+
+
+def url_for(key: str):
+    return f"{SPACE_URI}/{key}"
+
+
+def put_bytes(key: str, data: bytes, content_type: str):
+    get_client().upload_fileobj(
+        io.BytesIO(data),
         SPACE_NAME,
-        file_name,
+        key,
         ExtraArgs={
             "ACL": "public-read",
-            "ContentType": "image/png",
+            "ContentType": content_type,
         },
+        Config=small_transfer,
     )
 
-    return f"{SPACE_URI}/{file_name}"
+    return url_for(key)
+
+
+def get_bytes(key: str):
+    try:
+        return get_client().get_object(Bucket=SPACE_NAME, Key=key)["Body"].read()
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+            return None
+        raise
+
+
+def exists(key: str):
+    try:
+        get_client().head_object(Bucket=SPACE_NAME, Key=key)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
@@ -0,0 +1,124 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+
+from services import s3
+
+# where generated files (draw images...) are stored: "s3" (default), "local" or "memory"
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "s3").lower()
+# local backend directory, and the url prefix the app serves it from (see /files in dxf_route)
+STORAGE_DIR = os.environ.get("STORAGE_DIR", "./storage")
+STORAGE_PUBLIC_URL = os.environ.get("STORAGE_PUBLIC_URL", "/api/dxf/files")
+
+
+class Storage(ABC):
+    """
+    Key -> bytes store of the generated files. put() returns the public url of the key.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def put(self, key: str, data: bytes, content_type: str) -> str: ...
+
+    @abstractmethod
+    def get(self, key: str) -> bytes | None: ...
+
+    def exists(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def url(self, key: str) -> str:
+        return f"{STORAGE_PUBLIC_URL}/{key}"
+
+
+class S3Storage(Storage):
+    name = "s3"
+
+    def put(self, key, data, content_type):
+        return s3.put_bytes(key, data, content_type)
+
+    def get(self, key):
+        return s3.get_bytes(key)
+
+    def exists(self, key):
+        return s3.exists(key)
+
+    def url(self, key):
+        return s3.url_for(key)
+
+
+class LocalStorage(Storage):
+    name = "local"
+
+    def __init__(self, root: str = STORAGE_DIR):
+        self.root = os.path.abspath(root)
+
+    def path(self, key: str):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Error: invalid storage key '{key}'")
+        return path
+
+    def put(self, key, data, content_type):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, a reader never sees half a file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return self.url(key)
+
+    def get(self, key):
+        path = self.path(key)
+        if not os.path.isfile(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+
+class MemoryStorage(Storage):
+    name = "memory"
+
+    def __init__(self):
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def put(self, key, data, content_type):
+        with self._lock:
+            self._files[key] = bytes(data)
+        return self.url(key)
+
+    def get(self, key):
+        with self._lock:
+            return self._files.get(key)
+
+    def exists(self, key):
+        with self._lock:
+            return key in self._files
+
+
+BACKENDS = {
+    "s3": S3Storage,
+    "local": LocalStorage,
+    "memory": MemoryStorage,
+}
+
+_storage = None
+_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    """
+    The configured backend (STORAGE_BACKEND), created on first use.
+    """
+    global _storage
+    with _lock:
+        if _storage is None:
+            if STORAGE_BACKEND not in BACKENDS:
+                raise ValueError(f"Error: unknown storage backend '{STORAGE_BACKEND}', use one of {list(BACKENDS)}")
+            _storage = BACKENDS[STORAGE_BACKEND]()
+        return _storage
@@ -0,0 +1,81 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from services.storage import get_storage
+from utils.cache import LRUCache
+
+# background uploads of generated files (/draw with defer_upload)
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", 8))
+# how many upload statuses are remembered, older keys fall back to a storage check
+UPLOAD_STATUS_SIZE = int(os.environ.get("UPLOAD_STATUS_SIZE", 4096))
+
+PENDING, READY, FAILED, MISSING = "pending", "ready", "failed", "missing"
+
+# key -> {"status", "error"}
+statuses = LRUCache(max_size=UPLOAD_STATUS_SIZE)
+_pool = None
+_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+        return _pool
+
+
+def _upload(key, data, content_type):
+    try:
+        get_storage().put(key, data, content_type)
+    except Exception as e:
+        statuses.set(key, {"status": FAILED, "error": f"{type(e).__name__}: {e}"})
+        raise
+    statuses.set(key, {"status": READY})
+
+
+def submit(files, on_done=None):
+    """
+    Queues the uploads of files [(key, data, content_type)] on the uploader pool and returns
+    their public urls right away. on_done() runs once every file is stored (not on failure).
+    """
+    storage = get_storage()
+    remaining = [len(files)]
+    remaining_lock = threading.Lock()
+
+    def done(future):
+        if future.exception() is not None:
+            return
+        with remaining_lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last and on_done:
+            on_done()
+
+    urls = []
+    for key, data, content_type in files:
+        statuses.set(key, {"status": PENDING})
+        _executor().submit(_upload, key, data, content_type).add_done_callback(done)
+        urls.append(storage.url(key))
+    return urls
+
+
+def status(key: str) -> dict:
+    """
+    {"status": pending | ready | failed | missing (, "error")} of a key. Keys this process
+    did not upload (or forgot) are looked up in the storage.
+    """
+    known = statuses.get(key)
+    if known is not None:
+        return known
+    return {"status": READY if get_storage().exists(key) else MISSING}
+
+
+def shutdown(wait: bool = True):
+    # waits for the queued uploads by default, their urls were already handed out
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait)
+            _pool = None
@@ -0,0 +1,34 @@
+import unittest
+
+from routers.dxf_route import draw_entities_job
+from utils.dxf_v1 import lod
+
+
+def tiny_lines(n):
+    # n sub-pixel LINEs packed in a few pixels of a large drawing, the raster cull merges them
+    lines = [
+        {"entity_type": "LINE", "aci": 1, "layer": "0", "start": {"x": i * 0.001, "y": 0}, "end": {"x": i * 0.001 + 0.0005, "y": 0}}
+        for i in range(n)
+    ]
+    lines.append({"entity_type": "LINE", "aci": 1, "layer": "0", "start": {"x": 0, "y": 0}, "end": {"x": 10000, "y": 10000}})
+    return lines
+
+
+class DrawLodTest(unittest.TestCase):
+    def test_png_is_culled(self):
+        coords = tiny_lines(lod.LOD_MIN_ENTITIES)
+        entities, culled = draw_entities_job(coords, None, None, False, None, 16, fmt="png")
+        self.assertGreater(culled, 0)
+        self.assertEqual(len(entities) + culled, len(coords))
+
+    def test_vector_formats_keep_every_entity(self):
+        coords = tiny_lines(lod.LOD_MIN_ENTITIES)
+        for fmt in lod.VECTOR_FORMATS:
+            with self.subTest(fmt=fmt):
+                entities, culled = draw_entities_job(coords, None, None, False, None, 16, fmt=fmt)
+                self.assertEqual(culled, 0)
+                self.assertEqual(entities, coords)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import ezdxf
+import numpy as np
+
+# 0-255 RGB of every ACI, built once at import (index 0 - BYBLOCK - is black)
+ACI_RGB8 = np.zeros((256, 3), dtype=np.uint8)
+ACI_RGB8[1:] = [tuple(ezdxf.colors.aci2rgb(aci)) for aci in range(1, 256)]
+# the same, normalized for matplotlib
+ACI_RGB = ACI_RGB8 / 255.0
+# and as SVG colors
+ACI_HEX = ["#%02x%02x%02x" % tuple(rgb) for rgb in ACI_RGB8.tolist()]
+
+
+def resolve_aci(aci, secondary_aci=None, default=0):
+    """
+    Vectorized "secondary_aci or aci": the ACI entities are drawn with, from arrays of
+    aci / secondary_aci. A secondary_aci of 0 means none, any ACI outside 1-255 (missing,
+    BYBLOCK, BYLAYER...) is invalid and gives default.
+    """
+    aci = np.asarray(aci, dtype=np.int64)
+    if secondary_aci is not None:
+        secondary_aci = np.asarray(secondary_aci, dtype=np.int64)
+        aci = np.where(secondary_aci != 0, secondary_aci, aci)
+    return np.where((aci >= 1) & (aci <= 255), aci, default)
+
+
+def aci_array(entities, field="aci"):
+    # one column of ACIs as an int array, 0 where missing
+    return np.fromiter(
+        (value if isinstance(value, int) else 0 for value in (ent.get(field) for ent in entities)),
+        dtype=np.int64,
+        count=len(entities),
+    )
+
+
+def entity_acis(entities, default=0):
+    """
+    The resolved ACI of every entity (see resolve_aci).
+    """
+    return resolve_aci(aci_array(entities), aci_array(entities, "secondary_aci"), default)
+
+
+def entity_colors(entities):
+    """
+    (n, 3) normalized RGB of the entities.
+    """
+    return ACI_RGB[entity_acis(entities)]
@@ -1,37 +1,95 @@
+import io
 import os
-import ezdxf
-import matplotlib.pyplot as plt
+import uuid
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PatchCollection
+from matplotlib.patches import Circle
+from PIL import Image
 from collections import defaultdict
-from utils import unique
-from services import s3
+from services.storage import get_storage
+from utils.dxf_v1 import colors
 
 
-def aci_to_rgb(aci_color):
+# media type of every /draw output format
+CONTENT_TYPES = {
+    "png": "image/png",
+    "pdf": "application/pdf",
+    "svg": "image/svg+xml",
+}
+
+# largest /draw output side in pixels, bigger images are refused
+MAX_PIXELS = int(os.environ.get("DRAW_MAX_PIXELS", 8192))
+# most output widths one /draw call may ask for (sizes)
+MAX_SIZES = int(os.environ.get("DRAW_MAX_SIZES", 8))
+
+# normalized RGB of every ACI as tuples (index 0 is black), see dxf_v1.colors
+ACI_RGB = [tuple(rgb) for rgb in colors.ACI_RGB.tolist()]
+BLACK = ACI_RGB[0]
+
+
+def entity_styles(entities):
+    # (color, dashed) drawing group of every entity, colors resolved in one vectorized pass,
+    # dashed entities are drawn in black
+    acis = colors.entity_acis(entities).tolist()
+    return [
+        (BLACK, True) if ent.get("dashed", False) else (ACI_RGB[aci], False)
+        for ent, aci in zip(entities, acis)
+    ]
+
+
+def upload_image(data, name=None, fmt="png"):
+    """
+    Stores the image bytes straight from memory in the configured storage, returns the image url.
+    A given name (content hash...) always maps to the same object, so it is stored once.
+    """
+    return get_storage().put(image_key(name, fmt), data, CONTENT_TYPES[fmt])
+
+
+def image_key(name=None, fmt="png"):
+    # storage key of a /draw image, a random one without a name
+    return f"dxf-draws/{name or uuid.uuid4()}.{fmt}"
+
+
+def downsample(png, widths):
+    """
+    PNG copies of the image scaled down to each width (aspect kept), the image is decoded once.
+    A width equal to the image's own gets the original bytes, a larger one is refused.
     """
-    Convert an AutoCAD Color Index (ACI) to normalized RGB tuple.
-    If the ACI is 0 or invalid, default to black.
+    image = Image.open(io.BytesIO(png))
+    if max(widths) > image.width:
+        raise ValueError(f"Error: cannot downsample a {image.width}px wide image to {max(widths)}px")
+    # palette images (previews) are resampled in RGB, nearest neighbour would drop thin lines
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+
+    copies = []
+    for w in widths:
+        if w == image.width:
+            copies.append(png)
+            continue
+        h = max(1, round(image.height * w / image.width))
+        buffer = io.BytesIO()
+        image.resize((w, h), Image.Resampling.LANCZOS, reducing_gap=3.0).save(buffer, format="PNG")
+        copies.append(buffer.getvalue())
+    return copies
+
+
+def render_image(entities, width=20, height=16, dpi=72, viewport=None, fmt="png", exact_size=False):
+    """
+    Renders the entities and returns the image bytes, fmt is "png" or "pdf"
+    (see utils.dxf_v1.svg for SVG).
+    The figure lives on its own Agg canvas, nothing goes through pyplot's global
+    state, so renders can run in parallel threads.
+    viewport (x_min, y_min, x_max, y_max) fixes the axes limits instead of fitting
+    the whole drawing, texts are then clipped to it.
+    exact_size keeps the image at width x height inches (a requested pixel size) instead
+    of cropping the figure to its content.
     """
-    try:
-        if not aci_color or aci_color < 1 or aci_color > 255:
-            return (0, 0, 0)
-        r, g, b = ezdxf.colors.aci2rgb(aci_color)
-        return (r / 255, g / 255, b / 255)
-    except Exception:
-        return (0, 0, 0)
-
-
-def draw_entities(
-    entities,
-    width=20,
-    height=16,
-    dpi=72,
-    file_path=None,
-):
-    os.makedirs("./tmp", exist_ok=True)
-    if not file_path:
-        file_path = "./tmp/" + unique.unique_string(20) + ".png"
-
-    fig, ax = plt.subplots(figsize=(width, height), dpi=dpi)
+    fig = Figure(figsize=(width, height), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
     ax.set_aspect("equal")
     ax.grid(True)
 
@@ -40,60 +98,75 @@ def draw_entities(
         grouped[ent.get("entity_type")].append(ent)
 
     # ---- POINT ----
-    for pt in grouped.get("POINT", []):
-        ax.scatter(
-            pt.get("x", 0), pt.get("y", 0), color=aci_to_rgb(pt.get("secondary_aci") or pt.get("aci")), s=30
-        )
+    points = grouped.get("POINT", [])
+    if points:
+        xy = np.array([(pt.get("x", 0), pt.get("y", 0)) for pt in points], dtype=float)
+        ax.scatter(xy[:, 0], xy[:, 1], color=colors.entity_colors(points), s=30)
+
+    # ---- LINE & LWPOLYLINE ----
+    # every segment goes into one LineCollection per (color, dashed)
+    segments = defaultdict(list)
 
-    # ---- LINE ----
-    for ln in grouped.get("LINE", []):
+    lines = grouped.get("LINE", [])
+    for ln, style in zip(lines, entity_styles(lines)):
         start, end = ln.get("start"), ln.get("end")
         if not start or not end:
             continue
 
-        is_dashed = ln.get("dashed", False)
-
-        ax.plot(
-            [start["x"], end["x"]],
-            [start["y"], end["y"]],
-            color="black" if is_dashed else aci_to_rgb(ln.get("secondary_aci") or ln.get("aci")),
-            linestyle="--" if is_dashed else "-",
-            linewidth=1.2,
+        segments[style].append(
+            np.array([[(start["x"], start["y"]), (end["x"], end["y"])]], dtype=float)
         )
 
-    # ---- LWPOLYLINE ----
-    for poly in grouped.get("LWPOLYLINE", []):
+    polys = grouped.get("LWPOLYLINE", [])
+    for poly, style in zip(polys, entity_styles(polys)):
         pts = poly.get("vertices", [])
         if not pts or len(pts) < 2:
             continue
 
         draw_pts = pts + [pts[0]] if poly.get("closed") else pts
-        is_dashed = poly.get("dashed", False)
-
-        for j in range(len(draw_pts) - 1):
-            x1, y1 = draw_pts[j]["x"], draw_pts[j]["y"]
-            x2, y2 = draw_pts[j + 1]["x"], draw_pts[j + 1]["y"]
-
-            ax.plot(
-                [x1, x2],
-                [y1, y2],
-                color="black" if is_dashed else aci_to_rgb(poly.get("secondary_aci") or poly.get("aci")),
-                linestyle="--" if is_dashed else "-",
-                linewidth=1.2,
+        xy = np.array([(p["x"], p["y"]) for p in draw_pts], dtype=float)
+        segments[style].append(np.stack((xy[:-1], xy[1:]), axis=1))
+
+    for (color, is_dashed), parts in segments.items():
+        ax.add_collection(
+            LineCollection(
+                np.concatenate(parts),
+                colors=[color],
+                linestyles="--" if is_dashed else "-",
+                linewidths=1.2,
+                # same caps as ax.plot lines
+                capstyle="butt" if is_dashed else "projecting",
+                zorder=2,
             )
+        )
 
     # circle
-    for cir in grouped.get("CIRCLE", []):
-        is_dashed = cir.get("dashed", False)
+    circles = defaultdict(list)
+    cirs = grouped.get("CIRCLE", [])
+    for cir, style in zip(cirs, entity_styles(cirs)):
         center = cir.get("center")
-        circle = plt.Circle((center["x"], center["y"]), cir.get("radius"), fill=False, 
-                color="black" if is_dashed else aci_to_rgb(cir.get("secondary_aci") or cir.get("aci")),
-                linestyle="--" if is_dashed else "-",
-                linewidth=1.2,)
-        ax.add_patch(circle)
+        circles[style].append(Circle((center["x"], center["y"]), cir.get("radius")))
+
+    for (color, is_dashed), patches in circles.items():
+        ax.add_collection(
+            PatchCollection(
+                patches,
+                facecolors="none",
+                edgecolors=[color],
+                linestyles="--" if is_dashed else "-",
+                linewidths=1.2,
+            )
+        )
+
+    if viewport:
+        ax.set_xlim(viewport[0], viewport[2])
+        ax.set_ylim(viewport[1], viewport[3])
+    else:
+        ax.autoscale_view()
 
     # ---- TEXT ----
-    for txt in grouped.get("TEXT", []):
+    texts = grouped.get("TEXT", [])
+    for txt, aci in zip(texts, colors.entity_acis(texts).tolist()):
         pos = txt.get("position", {})
         x, y = pos.get("x", 0), pos.get("y", 0)
         fontsize = txt.get("height", 12)
@@ -103,16 +176,18 @@ def draw_entities(
             x,
             y,
             txt.get("text", ""),
-            color=aci_to_rgb(txt.get("secondary_aci") or txt.get("aci")),
+            color=ACI_RGB[aci],
             fontsize=fontsize,
             rotation=rotation,  # Apply rotation
             rotation_mode="anchor",  # Ensures rotation around (x,y) position
+            clip_on=viewport is not None,
             ha="center",  # Horizontal alignment
             va="center",  # Vertical alignment
         )
 
     # ---- MTEXT ----
-    for txt in grouped.get("MTEXT", []):
+    mtexts = grouped.get("MTEXT", [])
+    for txt, aci in zip(mtexts, colors.entity_acis(mtexts).tolist()):
         x, y = txt.get("x", 0), txt.get("y", 0)
 
         fontsize = txt.get("height", 12)
@@ -127,20 +202,24 @@ def draw_entities(
             x,
             y,
             text_value,
-            color=aci_to_rgb(txt.get("secondary_aci") or txt.get("aci")),
+            color=ACI_RGB[aci],
             fontsize=fontsize,
             rotation=rotation,
             rotation_mode="anchor",
+            clip_on=viewport is not None,
             ha="left",  # MTEXT is usually left-aligned in CAD
             va="center",
         )
 
-    plt.title("Entities")
-    plt.xlabel("X axis")
-    plt.ylabel("Y axis")
-    plt.savefig(file_path, dpi=dpi, bbox_inches="tight")
-    plt.close()
-
-    image_path = s3.upload_file(file_path)
-
-    return image_path, file_path
+    ax.set_title("Entities")
+    ax.set_xlabel("X axis")
+    ax.set_ylabel("Y axis")
+    buffer = io.BytesIO()
+    if exact_size:
+        # the margins are tightened inside the figure, its size stays the requested one
+        fig.tight_layout()
+        fig.savefig(buffer, format=fmt, dpi=dpi)
+    else:
+        fig.savefig(buffer, format=fmt, dpi=dpi, bbox_inches="tight")
+
+    return buffer.getvalue()
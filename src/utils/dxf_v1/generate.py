@@ -1,13 +1,34 @@
+import os
+import queue
+import threading
+import zlib
 import ezdxf
 from utils import unique
+from utils.dxf_v1 import colors
 from ezdxf.enums import TextEntityAlignment
 
+# size of the DXF text chunks streamed to the client, and how many may wait for it
+STREAM_CHUNK_SIZE = int(os.environ.get("GENERATE_CHUNK_SIZE", 64 * 1024))
+STREAM_QUEUE_SIZE = 8
+# gzip level of /generate responses for clients accepting it (0 - off)
+GZIP_LEVEL = int(os.environ.get("GENERATE_GZIP_LEVEL", 6))
+
 
 def generate_dxf(entities: list[dict], file_path=None):
     """Generate a DXF file from a list of extracted entities, preserving layers."""
 
     if not file_path:
         file_path = "./tmp/" + unique.unique_string(20) + ".dxf"
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+
+    doc = build_dxf(entities)
+    doc.saveas(file_path)
+    print(f"✅ DXF successfully saved at: {file_path}")
+    return file_path
+
+
+def build_dxf(entities: list[dict]):
+    """Build the ezdxf document of a list of extracted entities, preserving layers."""
 
     doc = ezdxf.new(dxfversion="R2010")
     msp = doc.modelspace()
@@ -25,11 +46,12 @@ def generate_dxf(entities: list[dict], file_path=None):
         )
 
     existing_layers = {}
+    # secondary_aci or aci of every entity at once, default color if missing
+    acis = colors.entity_acis(entities, default=7).tolist()
 
-    for ent in entities:
+    for ent, aci in zip(entities, acis):
         etype = ent.get("entity_type")
         layer = ent.get("layer", "0")
-        aci = ent.get("secondary_aci") or ent.get("aci") or 7   # default color if missing
 
         # Create layer if needed
         if layer not in existing_layers:
@@ -108,6 +130,106 @@ def generate_dxf(entities: list[dict], file_path=None):
         else:
             print(f"⚠️ Skipping unsupported entity type: {etype}")
 
-    doc.saveas(file_path)
-    print(f"✅ DXF successfully saved at: {file_path}")
-    return file_path
+    return doc
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _ChunkWriter:
+    """
+    Text stream for doc.write(), encodes what it gets into chunks of about
+    STREAM_CHUNK_SIZE and hands them out through a bounded queue.
+    """
+
+    def __init__(self, chunks, encoding, stop):
+        self.chunks = chunks
+        self.encoding = encoding
+        self.stop = stop
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= STREAM_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            # dxfreplace (registered by ezdxf) is the error handler DXF output needs
+            self.put("".join(self.parts).encode(self.encoding, errors="dxfreplace"))
+            self.parts, self.size = [], 0
+
+    def put(self, item):
+        # waits for the reader, gives up once it is gone (client disconnected)
+        while True:
+            if self.stop.is_set():
+                raise _Cancelled()
+            try:
+                self.chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+
+def _next_chunk(chunks, producer):
+    # waits for the writer, a start() future that failed before writing ends the stream
+    while True:
+        try:
+            return chunks.get(timeout=0.5)
+        except queue.Empty:
+            if producer is not None and producer.done() and producer.exception() is not None:
+                raise producer.exception()
+
+
+def stream_dxf(doc, gzip_level=0, start=None):
+    """
+    Yields the DXF file of the document in chunks (bytes) while a background thread
+    writes it, nothing goes to disk. gzip_level 1-9 turns the output into a gzip stream.
+    start(write) runs the writer in the background (a new thread by default), its return
+    value is kept until the stream ends.
+    """
+    chunks = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    stop = threading.Event()
+    done = object()
+    writer = _ChunkWriter(chunks, doc.output_encoding, stop)
+
+    def write():
+        if stop.is_set(): # the reader was gone before the writer got to run
+            return
+        try:
+            doc.write(writer, fmt="asc")
+            writer.flush()
+            result = done
+        except _Cancelled:
+            return
+        except Exception as e:
+            result = e
+        try:
+            writer.put(result)
+        except _Cancelled:
+            pass
+
+    if start is None:
+        threading.Thread(target=write, name="dxf-stream", daemon=True).start()
+        producer = None
+    else:
+        producer = start(write)
+    compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if gzip_level else None
+    try:
+        while True:
+            item = _next_chunk(chunks, producer)
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            if compressor:
+                item = compressor.compress(item)
+            if item:
+                yield item
+        if compressor:
+            yield compressor.flush()
+    finally:
+        stop.set()
@@ -0,0 +1,148 @@
+import os
+import numpy as np
+from matplotlib import rcParams
+
+# geometry smaller than this many output pixels is culled or merged (0 - off)
+LOD_PIXELS = float(os.environ.get("DRAW_LOD_PIXELS", 1.0))
+# smaller drawings are rendered as they are
+LOD_MIN_ENTITIES = int(os.environ.get("DRAW_LOD_MIN_ENTITIES", 5000))
+# vector outputs are never culled, they can be zoomed past the pixel grid
+VECTOR_FORMATS = ("svg", "pdf")
+
+
+def label_filter(show_length, shifts, show_length_acis):
+    """
+    Which entities get a length label or a marker in the /draw pipeline (cal_length runs
+    when show_length or shifts is set), those are never culled. Dashed entities
+    come from coordinates2 and are never labeled.
+    """
+    if not (show_length or shifts):
+        return None
+    acis = set(show_length_acis) if show_length_acis is not None else None
+
+    def is_labeled(ent):
+        if ent.get("dashed") or ent.get("entity_type") not in ("LINE", "LWPOLYLINE", "CIRCLE"):
+            return False
+        return acis is None or (ent.get("secondary_aci") or ent.get("aci", 0)) in acis
+
+    return is_labeled
+
+
+def drawing_extent(entities):
+    # (x_min, y_min, x_max, y_max) of the geometry, texts excluded like matplotlib's autoscale
+    xs, ys = [], []
+    for ent in entities:
+        etype = ent.get("entity_type")
+        if etype == "LINE" and ent.get("start") and ent.get("end"):
+            xs += [ent["start"]["x"], ent["end"]["x"]]
+            ys += [ent["start"]["y"], ent["end"]["y"]]
+        elif etype == "LWPOLYLINE":
+            for p in ent.get("vertices") or []:
+                xs.append(p["x"])
+                ys.append(p["y"])
+        elif etype == "POINT":
+            xs.append(ent.get("x", 0))
+            ys.append(ent.get("y", 0))
+        elif etype == "CIRCLE" and ent.get("center"):
+            r = ent.get("radius") or 0
+            xs += [ent["center"]["x"] - r, ent["center"]["x"] + r]
+            ys += [ent["center"]["y"] - r, ent["center"]["y"] + r]
+    if not xs:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def pixel_size(entities, width=20, height=16, dpi=72, extent=None):
+    """
+    World units per output pixel: the axes box of the figure (default subplot params)
+    with an equal aspect fitted around the drawing extent (or the given one).
+    """
+    extent = extent or drawing_extent(entities)
+    if extent is None:
+        return 0.0
+    x0, y0, x1, y1 = extent
+    axes_w = width * dpi * (rcParams["figure.subplot.right"] - rcParams["figure.subplot.left"])
+    axes_h = height * dpi * (rcParams["figure.subplot.top"] - rcParams["figure.subplot.bottom"])
+    return max((x1 - x0) / axes_w, (y1 - y0) / axes_h)
+
+
+def _style(ent):
+    return bool(ent.get("dashed", False)), ent.get("secondary_aci") or ent.get("aci")
+
+
+def cull(entities, width=20, height=16, dpi=72, keep=None, pixels=LOD_PIXELS, min_entities=LOD_MIN_ENTITIES, extent=None):
+    """
+    Level of detail pass ahead of rendering, geometry is projected on the output pixel grid:
+      - LINEs joining the same pixels with the same style are merged into one, so all the
+        sub-pixel LINEs of a pixel become a single dot
+      - LWPOLYLINE vertices staying in the pixel of the previous vertex are dropped
+      - sub-pixel CIRCLEs and POINTs are merged per pixel and color
+    TEXT / MTEXT and the entities keep(ent) is true for (labeled ones) are left as they are.
+    extent is the rendered area (a viewport), the whole drawing by default.
+    Returns (entities, number of culled entities).
+    """
+    if not pixels or len(entities) < min_entities:
+        return entities, 0
+    cell = pixels * pixel_size(entities, width, height, dpi, extent)
+    if cell <= 0:
+        return entities, 0
+
+    result = [None] * len(entities)
+    culled = 0
+
+    # ---- LINE, all together ----
+    lines = [
+        i for i, ent in enumerate(entities)
+        if ent.get("entity_type") == "LINE" and ent.get("start") and ent.get("end") and not (keep and keep(ent))
+    ]
+    if lines:
+        xy = np.array(
+            [(entities[i]["start"]["x"], entities[i]["start"]["y"], entities[i]["end"]["x"], entities[i]["end"]["y"]) for i in lines],
+            dtype=float,
+        )
+        cells = np.floor(xy / cell).astype(np.int64)
+        # a segment and its reverse join the same pixels
+        swap = (cells[:, 0] > cells[:, 2]) | ((cells[:, 0] == cells[:, 2]) & (cells[:, 1] > cells[:, 3]))
+        cells[swap] = cells[swap][:, [2, 3, 0, 1]]
+        seen = set()
+        for k, i in enumerate(lines):
+            signature = (_style(entities[i]), *cells[k])
+            if signature not in seen:
+                seen.add(signature)
+                result[i] = entities[i]
+            else:
+                culled += 1
+        skip = set(lines)
+    else:
+        skip = set()
+
+    points_seen = set()
+    for i, ent in enumerate(entities):
+        if i in skip:
+            continue
+        etype = ent.get("entity_type")
+        if keep and keep(ent):
+            result[i] = ent
+
+        elif etype == "LWPOLYLINE" and len(ent.get("vertices") or []) >= 2:
+            pts = ent["vertices"]
+            cells = np.floor(np.array([(p["x"], p["y"]) for p in pts], dtype=float) / cell).astype(np.int64)
+            moved = np.any(cells[1:] != cells[:-1], axis=1)
+            # first vertex, every vertex entering a new pixel, and the last one
+            kept = np.concatenate(([True], moved))
+            kept[-1] = True
+            result[i] = {**ent, "vertices": [p for p, k in zip(pts, kept) if k]}
+
+        elif etype == "POINT" or (etype == "CIRCLE" and ent.get("center") and 2 * (ent.get("radius") or 0) < cell):
+            x, y = (ent.get("x", 0), ent.get("y", 0)) if etype == "POINT" else (ent["center"]["x"], ent["center"]["y"])
+            signature = (etype, _style(ent), int(np.floor(x / cell)), int(np.floor(y / cell)))
+            if signature in points_seen:
+                culled += 1
+                continue
+            points_seen.add(signature)
+            result[i] = ent
+
+        else:
+            result[i] = ent
+
+    return [ent for ent in result if ent is not None], culled
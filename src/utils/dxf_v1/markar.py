@@ -1,4 +1,6 @@
+import numpy as np
 from constants import modes
+from utils.dxf_v1 import colors
 
 # ------------------ Helper functions ------------------
 
@@ -125,7 +127,7 @@ def add_text_to_line_group(line_group, marker_text, shift, text_height):
 
 
 def gas_sink_marker(
-    dxf_entities, marker_aci_target=152, marker_text=None, shift="", text_height=1.0
+    dxf_entities, marker_aci_target=152, marker_text=None, shift="", text_height=1.0, acis=None
 ):
     """
     Adds TEXT entities to boxes:
@@ -133,15 +135,15 @@ def gas_sink_marker(
       - 4 open LWPOLYLINEs forming a box
       - 4 LINEs forming a box
     Text will appear in the center of the box.
+    acis is the precomputed colors.aci_array of (the leading) dxf_entities.
     """
     new_entities = []
+    if acis is None:
+        acis = colors.aci_array(dxf_entities)
+    targets = [dxf_entities[i] for i in np.flatnonzero(acis == marker_aci_target)]
 
     # --- LWPOLYLINEs ---
-    lwpolys = [
-        e
-        for e in dxf_entities
-        if e.get("entity_type") == "LWPOLYLINE" and e.get("aci") == marker_aci_target
-    ]
+    lwpolys = [e for e in targets if e.get("entity_type") == "LWPOLYLINE"]
     closed_lwpolys = [p for p in lwpolys if p.get("closed")]
     open_lwpolys = [p for p in lwpolys if not p.get("closed")]
 
@@ -157,11 +159,7 @@ def gas_sink_marker(
         new_entities += add_text_to_lwpoly_group(group, marker_text, shift, text_height)
 
     # --- LINEs ---
-    lines = [
-        e
-        for e in dxf_entities
-        if e.get("entity_type") == "LINE" and e.get("aci") == marker_aci_target
-    ]
+    lines = [e for e in targets if e.get("entity_type") == "LINE"]
     for i in range(0, len(lines), 4):
         group = lines[i : i + 4]
         new_entities += add_text_to_line_group(group, marker_text, shift, text_height)
@@ -186,12 +184,15 @@ def create_markers(coords, shifts, text_height, show_length_acis=None):
         if mode in (modes.MODES["sink"], modes.MODES["gas"])
     ]
 
+    # ACIs of the boxes, computed once (markers only append TEXT entities)
+    acis = colors.aci_array(coords)
+
     # Apply markers (skip if ACI not in show_length_acis)
     for item in gas_sink_shifts:
         if acis_set is not None and item["aci"] not in acis_set:
             continue
         coords = gas_sink_marker(
-            coords, item["aci"], item["mode_text"], item["shift"], text_height
+            coords, item["aci"], item["mode_text"], item["shift"], text_height, acis
         )
     # Remove gas or sink lengths
     coords = [
@@ -0,0 +1,149 @@
+import io
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from utils.dxf_v1 import colors
+from utils.dxf_v1.svg import Transform, MARGIN
+
+# the canvas is a palette image indexed by ACI: pixels are drawn with the ACI itself and the
+# palette is this 0-255 RGB table (index 0 - black, 7 - white)
+ACI_PALETTE = colors.ACI_RGB8.flatten().tolist()
+BACKGROUND = 7
+# dash / gap length in pixels of dashed entities
+DASH, GAP = 6.0, 3.0
+POINT_RADIUS = 2
+
+
+@lru_cache(maxsize=1)
+def _font():
+    # Pillow's built-in bitmap font, loaded once per process
+    return ImageFont.load_default_imagefont()
+
+
+@lru_cache(maxsize=4096)
+def _text_size(text):
+    # labels repeat a lot ("120(3)"...), measure each once
+    left, top, right, bottom = _font().getbbox(text)
+    return right - left, bottom - top
+
+
+def _dashes(segments):
+    # splits (n, 4) pixel segments x0, y0, x1, y1 into their dash pieces
+    start, delta = segments[:, :2], segments[:, 2:] - segments[:, :2]
+    length = np.hypot(delta[:, 0], delta[:, 1])
+    counts = np.maximum(np.ceil(length / (DASH + GAP)), 1).astype(np.int64)
+    owner = np.repeat(np.arange(len(segments)), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    step = np.divide(1.0, length, out=np.zeros_like(length), where=length > 0)[owner]
+    t0 = np.minimum(k * (DASH + GAP) * step, 1.0)[:, None]
+    t1 = np.minimum(t0 + DASH * step[:, None], 1.0)
+    return np.hstack((start[owner] + delta[owner] * t0, start[owner] + delta[owner] * t1))
+
+
+def render_preview(entities, width=20, height=16, dpi=72, viewport=None):
+    """
+    Fast raster preview, returns PNG bytes. LINE / LWPOLYLINE / CIRCLE / POINT are drawn
+    straight on a Pillow canvas through one world -> pixel transform (the SVG one), TEXT and
+    MTEXT with the built-in bitmap font, unrotated. No axes, grid, title or antialiasing.
+    """
+    # world coordinates in flat lists, transformed all at once below
+    seg_xy, seg_ink, seg_dashed = [], [], []  # x0, y0, x1, y1 per segment
+    circle_xyr, circle_ink = [], []
+    point_xy, point_ink = [], []
+    text_xy, texts = [], []  # (value, ink, centered)
+
+    # palette index of every entity, dashed ones are black like in the full renderer
+    inks = colors.entity_acis(entities).tolist()
+
+    for ent, ink in zip(entities, inks):
+        dashed = bool(ent.get("dashed"))
+        ink = 0 if dashed else ink
+        etype = ent.get("entity_type")
+        if etype == "LINE":
+            start, end = ent.get("start"), ent.get("end")
+            if start and end:
+                seg_xy += (start["x"], start["y"], end["x"], end["y"])
+                seg_ink.append(ink)
+                seg_dashed.append(dashed)
+        elif etype == "LWPOLYLINE":
+            pts = ent.get("vertices") or []
+            if len(pts) >= 2:
+                draw_pts = pts + [pts[0]] if ent.get("closed") else pts
+                for a, b in zip(draw_pts, draw_pts[1:]):
+                    seg_xy += (a["x"], a["y"], b["x"], b["y"])
+                seg_ink += [ink] * (len(draw_pts) - 1)
+                seg_dashed += [dashed] * (len(draw_pts) - 1)
+        elif etype == "CIRCLE":
+            center = ent.get("center")
+            if center:
+                circle_xyr += (center["x"], center["y"], ent.get("radius") or 0)
+                circle_ink.append(ink)
+        elif etype == "POINT":
+            point_xy += (ent.get("x", 0), ent.get("y", 0))
+            point_ink.append(ink)
+        elif etype == "TEXT":
+            pos = ent.get("position") or {}
+            text_xy += (pos.get("x", 0), pos.get("y", 0))
+            texts.append((ent.get("text") or "", ink, True))
+        elif etype == "MTEXT":
+            text_xy += (ent.get("x", 0), ent.get("y", 0))
+            texts.append(((ent.get("text") or "").replace("\\P", "\n"), ink, False))
+
+    segs = np.array(seg_xy, dtype=float).reshape(-1, 4)
+    circles = np.array(circle_xyr, dtype=float).reshape(-1, 3)
+    pts = np.array(point_xy, dtype=float).reshape(-1, 2)
+
+    # geometry extent, texts excluded like the full renderer's autoscale
+    if viewport:
+        extent = viewport
+    else:
+        xs = np.concatenate((segs[:, 0], segs[:, 2], circles[:, 0] - circles[:, 2], circles[:, 0] + circles[:, 2], pts[:, 0]))
+        ys = np.concatenate((segs[:, 1], segs[:, 3], circles[:, 1] - circles[:, 2], circles[:, 1] + circles[:, 2], pts[:, 1]))
+        extent = (xs.min(), ys.min(), xs.max(), ys.max()) if xs.size else (0, 0, 1, 1)
+
+    width_px, height_px = round(width * dpi), round(height * dpi)
+    to_px = Transform(extent, width_px, height_px, 0 if viewport else MARGIN)
+
+    def pixels(xy):
+        # x, y columns pairs of world coordinates -> pixels
+        out = np.empty_like(xy)
+        out[:, 0::2] = (xy[:, 0::2] - to_px.x0) * to_px.scale
+        out[:, 1::2] = (to_px.y1 - xy[:, 1::2]) * to_px.scale
+        return out
+
+    image = Image.new("P", (width_px, height_px), BACKGROUND)
+    image.putpalette(ACI_PALETTE)
+    canvas = ImageDraw.Draw(image)
+
+    segs = pixels(segs)
+    dashed = np.array(seg_dashed, dtype=bool)
+    for xy, ink in zip(segs[~dashed].tolist(), np.array(seg_ink, dtype=int)[~dashed].tolist()):
+        canvas.line(xy, fill=ink)
+    if dashed.any():
+        for xy in _dashes(segs[dashed]).tolist():
+            canvas.line(xy, fill=0)
+
+    centers = pixels(circles[:, :2])
+    for (x, y), r, ink in zip(centers.tolist(), (circles[:, 2] * to_px.scale).tolist(), circle_ink):
+        canvas.ellipse((x - r, y - r, x + r, y + r), outline=ink)
+
+    r = POINT_RADIUS
+    for (x, y), ink in zip(pixels(pts).tolist(), point_ink):
+        canvas.ellipse((x - r, y - r, x + r, y + r), fill=ink)
+
+    if texts:
+        font = _font()
+        for (x, y), (value, ink, centered) in zip(pixels(np.array(text_xy, dtype=float).reshape(-1, 2)).tolist(), texts):
+            if "\n" in value:
+                canvas.multiline_text((x, y), value, fill=ink, font=font)
+                continue
+            # the bitmap font has no anchors, center it by hand
+            w, h = _text_size(value)
+            canvas.text((x - w / 2 if centered else x, y - h / 2), value, fill=ink, font=font)
+
+    buffer = io.BytesIO()
+    # speed over size, previews are short lived
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
@@ -0,0 +1,65 @@
+import dbm
+import json
+import os
+import threading
+
+from utils.cache import LRUCache, canonical_hash
+from utils.dxf_v1 import lod
+
+# render hash -> {"image_path", "culled"(, "images")} of the stored image(s), in memory (entries, seconds to live - 0 for no expiry)
+CACHE_SIZE = int(os.environ.get("DRAW_CACHE_SIZE", 1024))
+CACHE_TTL = float(os.environ.get("DRAW_CACHE_TTL", 0))
+# optional on-disk index so the urls survive restarts (a dbm file path)
+CACHE_INDEX = os.environ.get("DRAW_CACHE_INDEX") or None
+
+# bump when the renderer output changes, older images are then rendered again
+RENDER_VERSION = 2
+
+render_cache = LRUCache(max_size=CACHE_SIZE, ttl=CACHE_TTL)
+_index_lock = threading.Lock()
+
+
+def render_key(coordinates, coordinates2, shifts, show_length, show_length_acis, text_height, viewport=None, size=None, fmt="png", quality="full", sizes=None):
+    """
+    Canonical hash of a normalized /draw request, identical drawings get the same key
+    and so the same object in storage.
+    """
+    return canonical_hash(
+        {
+            "version": RENDER_VERSION,
+            "coordinates": coordinates,
+            "coordinates2": coordinates2 or None,
+            "shifts": shifts or None,
+            "show_length": bool(show_length),
+            "show_length_acis": show_length_acis,
+            "text_height": text_height,
+            "lod": [lod.LOD_PIXELS, lod.LOD_MIN_ENTITIES],
+            "viewport": list(viewport) if viewport else None,
+            "size": list(size) if size else None,
+            "format": fmt,
+            "quality": quality,
+            "sizes": list(sizes) if sizes else None,
+        }
+    )
+
+
+def lookup(key: str):
+    render = render_cache.get(key)
+    if render is None and CACHE_INDEX:
+        with _index_lock, dbm.open(CACHE_INDEX, "c") as index:
+            render = index.get(key)
+        if render is not None:
+            render = json.loads(render)
+            render_cache.set(key, render)
+    return render
+
+
+def store(key: str, render: dict):
+    render_cache.set(key, render)
+    if CACHE_INDEX:
+        with _index_lock, dbm.open(CACHE_INDEX, "c") as index:
+            index[key] = json.dumps(render)
+
+
+def stats() -> dict:
+    return {**render_cache.stats(), "index": CACHE_INDEX}
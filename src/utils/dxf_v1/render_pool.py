@@ -0,0 +1,110 @@
+import asyncio
+import multiprocessing
+import os
+import resource
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# long-lived render workers for /draw, "process" (default) or "thread" - the renderer
+# does not go through pyplot so threads are safe, but they share this process' GIL
+POOL_KIND = os.environ.get("DRAW_POOL_KIND", "process").lower()
+POOL_SIZE = int(os.environ.get("DRAW_POOL_SIZE", 2))
+# a worker is replaced after this many renders (0 - never)
+MAX_TASKS_PER_WORKER = int(os.environ.get("DRAW_POOL_MAX_TASKS", 200))
+# the whole pool is restarted once a worker's peak memory passes this many MB (0 - never, processes only)
+MAX_WORKER_RSS_MB = int(os.environ.get("DRAW_POOL_MAX_RSS_MB", 1024))
+
+_pool = None
+_lock = threading.Lock()
+
+
+# -------------------------------
+# Worker side
+# -------------------------------
+def _warm_up():
+    # runs once in every new worker: matplotlib's Agg canvas, the font cache and the ACI table
+    from matplotlib import font_manager
+    from matplotlib.backends import backend_agg  # noqa: F401
+
+    font_manager.findfont(font_manager.FontProperties())
+    from utils.dxf_v1 import draw  # noqa: F401 - builds draw.ACI_RGB
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _render(entities, options):
+    from utils.dxf_v1 import draw
+
+    return draw.render_image(entities, **options), _peak_rss_mb()
+
+
+def _ready():
+    return os.getpid()
+
+
+# -------------------------------
+# Server side
+# -------------------------------
+def _new_pool():
+    if POOL_KIND == "thread":
+        return ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="render", initializer=_warm_up)
+
+    # max_tasks_per_child is not available with fork, workers are spawned
+    return ProcessPoolExecutor(
+        max_workers=POOL_SIZE,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_warm_up,
+        max_tasks_per_child=MAX_TASKS_PER_WORKER or None,
+    )
+
+
+def start():
+    """
+    Creates the pool and starts its workers now, so the first /draw does not pay the warm up.
+    """
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = _new_pool()
+            for _ in range(POOL_SIZE):
+                _pool.submit(_ready)
+        return _pool
+
+
+def _restart(broken_pool):
+    # replaces the pool unless another request already did, running renders finish on the old one
+    global _pool
+    with _lock:
+        if _pool is broken_pool:
+            _pool = _new_pool()
+    broken_pool.shutdown(wait=False)
+
+
+async def render(entities, **options):
+    """
+    Renders the entities in a worker process, returns the image bytes.
+    options are passed to draw.render_image (width, height, dpi, viewport, fmt).
+    """
+    pool = start()
+    try:
+        png, peak_rss_mb = await asyncio.wrap_future(pool.submit(_render, entities, options))
+    except BrokenProcessPool:
+        # a worker died (out of memory...), the next renders get a fresh pool
+        _restart(pool)
+        raise
+
+    if POOL_KIND == "process" and MAX_WORKER_RSS_MB and peak_rss_mb > MAX_WORKER_RSS_MB:
+        _restart(pool)
+    return png
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -0,0 +1,141 @@
+import numpy as np
+
+# entities covering more grid cells than this are kept aside and always bbox tested
+MAX_CELLS_PER_ENTITY = 64
+
+
+def entity_bbox(ent):
+    """
+    (x_min, y_min, x_max, y_max) of an entity, None when it has no position.
+    """
+    etype = ent.get("entity_type")
+    if etype == "LINE":
+        start, end = ent.get("start"), ent.get("end")
+        if not start or not end:
+            return None
+        return min(start["x"], end["x"]), min(start["y"], end["y"]), max(start["x"], end["x"]), max(start["y"], end["y"])
+    if etype == "LWPOLYLINE":
+        pts = ent.get("vertices") or []
+        if not pts:
+            return None
+        xs = [p["x"] for p in pts]
+        ys = [p["y"] for p in pts]
+        return min(xs), min(ys), max(xs), max(ys)
+    if etype == "CIRCLE":
+        center = ent.get("center")
+        if not center:
+            return None
+        r = ent.get("radius") or 0
+        return center["x"] - r, center["y"] - r, center["x"] + r, center["y"] + r
+    if etype == "TEXT":
+        pos = ent.get("position") or {}
+        x, y = pos.get("x", 0), pos.get("y", 0)
+        return x, y, x, y
+    if etype in ("POINT", "MTEXT"):
+        x, y = ent.get("x", 0), ent.get("y", 0)
+        return x, y, x, y
+    return None
+
+
+def entity_bboxes(entities):
+    # (n, 4) array, NaN rows for entities without a position
+    nan = (np.nan, np.nan, np.nan, np.nan)
+    return np.array([entity_bbox(ent) or nan for ent in entities], dtype=float).reshape(-1, 4)
+
+
+class GridIndex:
+    """
+    Uniform grid over the entities' bounding boxes. Each cell lists the entities whose bbox
+    touches it (sorted cell keys + entity ids, built in one vectorized pass), so a query
+    only looks at the cells under the rectangle.
+    """
+
+    def __init__(self, bboxes):
+        self.bboxes = bboxes
+        valid = ~np.isnan(bboxes[:, 0])
+        ids = np.flatnonzero(valid)
+
+        if not ids.size:
+            self.size = 0
+            self.large = ids
+            self.keys = self.ids = np.empty(0, dtype=np.int64)
+            return
+
+        self.x0, self.y0 = bboxes[ids, 0].min(), bboxes[ids, 1].min()
+        x1, y1 = bboxes[ids, 2].max(), bboxes[ids, 3].max()
+        self.size = int(min(1024, max(1, np.ceil(np.sqrt(ids.size)))))
+        self.cell_w = (x1 - self.x0) / self.size or 1.0
+        self.cell_h = (y1 - self.y0) / self.size or 1.0
+
+        ix0, iy0 = self._cell(bboxes[ids, 0], bboxes[ids, 1])
+        ix1, iy1 = self._cell(bboxes[ids, 2], bboxes[ids, 3])
+        w = ix1 - ix0 + 1
+        counts = w * (iy1 - iy0 + 1)
+
+        big = counts > MAX_CELLS_PER_ENTITY
+        self.large = ids[big]
+        ids, ix0, iy0, w, counts = ids[~big], ix0[~big], iy0[~big], w[~big], counts[~big]
+
+        # one (cell key, entity id) row per covered cell
+        owner = np.repeat(np.arange(ids.size), counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        keys = (iy0[owner] + k // w[owner]) * self.size + ix0[owner] + k % w[owner]
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.ids = ids[owner[order]]
+
+    def _cell(self, x, y):
+        ix = np.clip(np.floor((x - self.x0) / self.cell_w), 0, self.size - 1).astype(np.int64)
+        iy = np.clip(np.floor((y - self.y0) / self.cell_h), 0, self.size - 1).astype(np.int64)
+        return ix, iy
+
+    def query(self, x_min, y_min, x_max, y_max):
+        """
+        Sorted ids of the entities whose bbox intersects the rectangle.
+        """
+        if not self.size:
+            return np.empty(0, dtype=np.int64)
+
+        (cx0, cx1), (cy0, cy1) = self._cell(np.array([x_min, x_max]), np.array([y_min, y_max]))
+        rows = np.arange(cy0, cy1 + 1) * self.size
+        lo = np.searchsorted(self.keys, rows + cx0, side="left")
+        hi = np.searchsorted(self.keys, rows + cx1, side="right")
+        parts = [self.ids[a:b] for a, b in zip(lo, hi)] + [self.large]
+        candidates = np.unique(np.concatenate(parts))
+
+        b = self.bboxes[candidates]
+        hit = (b[:, 0] <= x_max) & (b[:, 2] >= x_min) & (b[:, 1] <= y_max) & (b[:, 3] >= y_min)
+        return candidates[hit]
+
+
+def viewport_ids(entities, viewport, margin=0.0, keep=None):
+    """
+    Sorted indices of the entities intersecting the viewport (x_min, y_min, x_max, y_max)
+    grown by margin. keep(ent) entities are always included.
+    """
+    x_min, y_min, x_max, y_max = viewport
+    index = GridIndex(entity_bboxes(entities))
+    ids = index.query(x_min - margin, y_min - margin, x_max + margin, y_max + margin)
+    if keep:
+        kept = [i for i, ent in enumerate(entities) if keep(ent)]
+        ids = np.union1d(ids, np.array(kept, dtype=np.int64))
+    return ids
+
+
+def in_viewport(entities, viewport, margin=0.0, keep=None):
+    """
+    The entities intersecting the viewport grown by margin, in their original order
+    (see viewport_ids).
+    """
+    return [entities[i] for i in viewport_ids(entities, viewport, margin, keep)]
+
+
+def in_viewport_pairs(entities1, entities2, viewport, margin=0.0, keep=None):
+    """
+    in_viewport for two lists aligned by index (coordinates / coordinates2, see
+    merge_cor.merge_entities_with_dashed): an index is kept in both lists when either of
+    its entities is in the viewport, so the pairs stay aligned. margin and keep only
+    apply to entities1.
+    """
+    ids = np.union1d(viewport_ids(entities1, viewport, margin, keep), viewport_ids(entities2, viewport))
+    return [entities1[i] for i in ids if i < len(entities1)], [entities2[i] for i in ids if i < len(entities2)]
@@ -0,0 +1,127 @@
+from collections import defaultdict
+from xml.sax.saxutils import escape, quoteattr
+
+from utils.dxf_v1 import colors, lod
+
+# same look as the matplotlib renderer: 1.2pt lines, its "--" dash pattern, 30pt² points
+LINE_WIDTH = 1.2
+DASH_ARRAY = "4.44,1.92"
+POINT_RADIUS = 2.74
+# empty space around the drawing, as a fraction of its size (matplotlib's axes margins)
+MARGIN = 0.05
+
+
+class Transform:
+    """
+    World -> image pixel coordinates: the extent fitted in the image with an equal aspect,
+    centered, y pointing down.
+    """
+
+    def __init__(self, extent, width_px, height_px, margin):
+        x0, y0, x1, y1 = extent
+        dx, dy = (x1 - x0) or 1.0, (y1 - y0) or 1.0
+        x0, x1 = x0 - dx * margin, x1 + dx * margin
+        y0, y1 = y0 - dy * margin, y1 + dy * margin
+        self.scale = min(width_px / (x1 - x0), height_px / (y1 - y0))
+        self.x0 = x0 - (width_px / self.scale - (x1 - x0)) / 2
+        self.y1 = y1 + (height_px / self.scale - (y1 - y0)) / 2
+
+    def __call__(self, x, y):
+        return f"{(x - self.x0) * self.scale:.2f} {(self.y1 - y) * self.scale:.2f}"
+
+
+def _text(x, y, text, color, size, rotation, anchor):
+    lines = text.split("\n")
+    attrs = f'x="{x}" y="{y}" fill="{color}" font-size="{size:g}" text-anchor="{anchor}" dominant-baseline="central"'
+    if rotation:
+        attrs += f' transform="rotate({-rotation:g} {x} {y})"'
+    if len(lines) == 1:
+        return f"<text {attrs}>{escape(text)}</text>"
+    # vertically centered block, one tspan per line
+    first = -(len(lines) - 1) * 0.6
+    spans = "".join(
+        f'<tspan x="{x}" dy="{first if i == 0 else 1.2:g}em">{escape(line)}</tspan>' for i, line in enumerate(lines)
+    )
+    return f"<text {attrs}>{spans}</text>"
+
+
+def render_svg(entities, width=20, height=16, dpi=72, viewport=None):
+    """
+    Writes the entities as an SVG document (bytes) without going through matplotlib.
+    Geometry is grouped by layer, then one <path> per (color, dashed) holds every LINE and
+    LWPOLYLINE segment of the group. viewport (x_min, y_min, x_max, y_max) is the drawn
+    area, the whole drawing by default. No axes, grid or title, the image is the drawing.
+    """
+    width_px, height_px = round(width * dpi), round(height * dpi)
+    extent = viewport or lod.drawing_extent(entities) or (0, 0, 1, 1)
+    to_px = Transform(extent, width_px, height_px, 0 if viewport else MARGIN)
+
+    # layer -> (color, dashed) -> path data / circles / points, texts are drawn on top
+    paths = defaultdict(lambda: defaultdict(list))
+    circles = defaultdict(lambda: defaultdict(list))
+    points = defaultdict(lambda: defaultdict(list))
+    texts = []
+
+    for ent, aci in zip(entities, colors.entity_acis(entities).tolist()):
+        etype = ent.get("entity_type")
+        layer = str(ent.get("layer") or "0")
+        color = colors.ACI_HEX[aci]
+        # (color, dashed), dashed entities are drawn in black
+        style = (colors.ACI_HEX[0], True) if ent.get("dashed", False) else (color, False)
+
+        if etype == "LINE":
+            start, end = ent.get("start"), ent.get("end")
+            if start and end:
+                paths[layer][style].append(
+                    f"M{to_px(start['x'], start['y'])}L{to_px(end['x'], end['y'])}"
+                )
+
+        elif etype == "LWPOLYLINE":
+            pts = ent.get("vertices") or []
+            if len(pts) >= 2:
+                d = "M" + "L".join(to_px(p["x"], p["y"]) for p in pts)
+                paths[layer][style].append(d + "Z" if ent.get("closed") else d)
+
+        elif etype == "CIRCLE":
+            center = ent.get("center")
+            if center:
+                cx, cy = to_px(center["x"], center["y"]).split()
+                r = (ent.get("radius") or 0) * to_px.scale
+                circles[layer][style].append(f'<circle cx="{cx}" cy="{cy}" r="{r:.2f}"/>')
+
+        elif etype == "POINT":
+            cx, cy = to_px(ent.get("x", 0), ent.get("y", 0)).split()
+            points[layer][color].append(f'<circle cx="{cx}" cy="{cy}" r="{POINT_RADIUS}"/>')
+
+        elif etype in ("TEXT", "MTEXT"):
+            if etype == "TEXT":
+                pos = ent.get("position") or {}
+                x, y = to_px(pos.get("x", 0), pos.get("y", 0)).split()
+                value, anchor = ent.get("text", "") or "", "middle"
+            else:
+                x, y = to_px(ent.get("x", 0), ent.get("y", 0)).split()
+                value, anchor = (ent.get("text", "") or "").replace("\\P", "\n"), "start"
+            texts.append(_text(x, y, value, color, ent.get("height") or 12, ent.get("rotation") or 0, anchor))
+
+    out = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width_px}" height="{height_px}" '
+        f'viewBox="0 0 {width_px} {height_px}">\n'
+        '<rect width="100%" height="100%" fill="#ffffff"/>\n'
+    ]
+    for layer in sorted(set(paths) | set(circles) | set(points)):
+        out.append(f'<g data-layer={quoteattr(layer)} fill="none" stroke-width="{LINE_WIDTH}">\n')
+        for (color, is_dashed), parts in paths[layer].items():
+            dash = f' stroke-dasharray="{DASH_ARRAY}"' if is_dashed else ' stroke-linecap="square"'
+            out.append(f'<path stroke="{color}"{dash} d="{"".join(parts)}"/>\n')
+        for (color, is_dashed), parts in circles[layer].items():
+            dash = f' stroke-dasharray="{DASH_ARRAY}"' if is_dashed else ""
+            out.append(f'<g stroke="{color}"{dash}>{"".join(parts)}</g>\n')
+        for color, parts in points[layer].items():
+            out.append(f'<g fill="{color}" stroke="none">{"".join(parts)}</g>\n')
+        out.append("</g>\n")
+
+    if texts:
+        out.append('<g font-family="DejaVu Sans, sans-serif">\n' + "\n".join(texts) + "\n</g>\n")
+    out.append("</svg>\n")
+    return "".join(out).encode("utf-8")
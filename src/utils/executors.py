@@ -0,0 +1,64 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# where the heavy endpoint stages run: "thread" (default) or "process" for multiple cores
+EXECUTOR_KIND = os.environ.get("DXF_EXECUTOR", "thread").lower()
+EXECUTOR_WORKERS = int(os.environ.get("DXF_EXECUTOR_WORKERS", 0)) or None
+
+# how many requests of each endpoint may run their heavy stage at the same time
+# (draw only prepares and uploads here, rendering goes through dxf_v1.render_pool)
+ENDPOINT_LIMITS = {
+    "extract": int(os.environ.get("DXF_LIMIT_EXTRACT", 4)),
+    "draw": int(os.environ.get("DXF_LIMIT_DRAW", 4)),
+    "generate": int(os.environ.get("DXF_LIMIT_GENERATE", 4)),
+    "convert-dwg": int(os.environ.get("DXF_LIMIT_CONVERT", 2)),
+    "shift": int(os.environ.get("DXF_LIMIT_SHIFT", 4)),
+}
+
+_executors = {}
+_semaphores = {}
+_lock = threading.Lock()
+
+
+def _executor(kind: str):
+    with _lock:
+        if kind not in _executors:
+            if kind == "process":
+                # spawned, forking a server process with running threads can deadlock the workers
+                _executors[kind] = ProcessPoolExecutor(
+                    max_workers=EXECUTOR_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+            elif kind == "thread":
+                _executors[kind] = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="dxf")
+            else:
+                raise ValueError(f"Error: unknown executor '{kind}', use thread or process")
+        return _executors[kind]
+
+
+def _semaphore(endpoint: str):
+    if endpoint not in _semaphores:
+        _semaphores[endpoint] = asyncio.Semaphore(ENDPOINT_LIMITS.get(endpoint, 1))
+    return _semaphores[endpoint]
+
+
+async def run(endpoint: str, fn, *args, local: bool = False, **kwargs):
+    """
+    Runs fn(*args, **kwargs) off the event loop within the endpoint's concurrency limit.
+    local=True keeps it in a thread of this process, for work that needs the process
+    state (shift sessions...) or arguments that cannot be pickled.
+    """
+    kind = "thread" if local else EXECUTOR_KIND
+    async with _semaphore(endpoint):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor(kind), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown():
+    with _lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()